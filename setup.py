@@ -25,6 +25,8 @@ setup (name =  'srange',
 	download_url='no-URL-yet',
 	platforms='any',
 #	install_requires = ['numpy', ],
+	python_requires = '>=3.6',				# the asyncio support uses asynchronous generators
+	extras_require = {'numpy': ['numpy']},	# only needed for the methods that return numpy arrays
 	test_suite="tests", 
 	package_dir = {'': '.'},
 	packages = find_packages('.'),
@@ -32,10 +34,9 @@ setup (name =  'srange',
                      'Intended Audience :: Developers',
                      'License :: OSI Approved :: BSD License',
                      'Programming Language :: Python',
-                     'Programming Language :: Python :: 2',
-                     'Programming Language :: Python :: 2.7',
                      'Programming Language :: Python :: 3',
-                     'Programming Language :: Python :: 3.6.5',
+                     'Programming Language :: Python :: 3 :: Only',
+                     'Programming Language :: Python :: 3.6',
                      'Topic :: Scientific/Engineering',
                      ],
       )
@@ -1,3 +1,3 @@
-from .srange import srange
-from .symrange import symrange
-__all__ = ['srange', 'symrange']
+from .srange import srange, srange_iterator, srange_builder
+from .symrange import symrange, symrange_iterator
+__all__ = ['srange', 'srange_iterator', 'srange_builder', 'symrange', 'symrange_iterator']
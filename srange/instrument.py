@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# instrument.py
+#
+# $Id:    $
+# $URL: $
+#
+# Part of the "pydiffract" package
+#
+
+"""
+Opt-in instrumentation of srange, the number of calls, simple ranges visited and seconds spent
+in the parse, compact, iterate, index and lookup operations.
+
+This is the engine behind srange.set_stats(). While it is off (the default) nothing is changed,
+the class has its plain methods and there is no cost at all. enable() replaces the listed methods
+of the class with wrappers that time each call and add it to the global totals, to the totals of
+the instance and pass it on to any registered callbacks. disable() puts the plain methods back.
+Only the outermost instrumented call is counted, e.g. sr[3] counts one index call, not also the index()
+that __getitem__() uses, and the compacting done inside sub_srange() is part of that index call.
+"""
+
+import functools
+import threading
+from time import perf_counter
+from collections import namedtuple
+
+__version__	=	"$Revision: $"
+__author__	=	"Jon Tischler, <tischler@aps.anl.gov>" +\
+				"Argonne National Laboratory"
+__date__	=	"$Date: $"
+__id__		=	"$Id: $"
+
+
+OPERATIONS = ('parse', 'compact', 'iterate', 'index', 'lookup')
+OpStats = namedtuple('OpStats', ['calls', 'segments', 'seconds'])
+
+
+class Stats(object):
+	""" The totals of calls, segments and seconds for each of the operations. """
+
+	__slots__ = ('totals',)
+
+	def __init__(self):
+		self.totals = dict((op, [0, 0, 0.]) for op in OPERATIONS)
+
+	def add(self, op, segments, seconds):
+		""" Add one call of op that visited segments simple ranges in seconds. """
+		total = self.totals[op]
+		total[0] += 1
+		total[1] += segments
+		total[2] += seconds
+
+	def snapshot(self):
+		""" Return a dict of operation -> OpStats(calls, segments, seconds). """
+		return dict((op, OpStats(*total)) for (op, total) in self.totals.items())
+
+
+_lock = threading.Lock()
+_global = Stats()				# totals over all instances
+_callbacks = []					# functions called as callback(op, method, segments, seconds)
+_originals = {}					# (class, attribute name) -> the plain method, while enabled
+_local = threading.local()		# _local.active is True while an instrumented call runs in this thread
+
+
+def enable(cls, methods, instance_stats):
+	"""
+	Replace methods of cls with instrumented wrappers.
+	methods is a dict of attribute name -> (operation, segments), where segments(self, args, result)
+	returns the number of simple ranges visited by one call, and instance_stats(self) returns the Stats of an instance.
+	"""
+	with _lock:
+		for (name, (op, segments)) in methods.items():
+			if (cls, name) not in _originals:
+				func = cls.__dict__[name]
+				_originals[(cls, name)] = func
+				setattr(cls, name, _wrap(func, op, segments, instance_stats))
+
+
+def disable(cls):
+	""" Put the plain methods of cls back. """
+	with _lock:
+		for key in [key for key in _originals if key[0] is cls]:
+			setattr(cls, key[1], _originals.pop(key))
+
+
+def is_enabled(cls):
+	""" Return True if the methods of cls are instrumented. """
+	return any(key[0] is cls for key in _originals)
+
+
+def global_stats():
+	""" Return a dict of operation -> OpStats(calls, segments, seconds), the totals over all instances. """
+	with _lock:
+		return _global.snapshot()
+
+
+def clear():
+	""" Set the global totals back to zero. """
+	global _global
+	with _lock:
+		_global = Stats()
+
+
+def add_callback(callback):
+	""" Register callback(op, method, segments, seconds), called after each instrumented call. """
+	with _lock:
+		if callback not in _callbacks:
+			_callbacks.append(callback)
+
+
+def remove_callback(callback):
+	""" Unregister a callback, it is not an error if it was not registered. """
+	with _lock:
+		if callback in _callbacks:
+			_callbacks.remove(callback)
+
+
+def _wrap(func, op, segments, instance_stats):
+	""" Return a wrapper of func that records each call as op. """
+	method = func.__name__
+
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		if getattr(_local, 'active', False):	# called from inside another instrumented call, not counted
+			return func(self, *args, **kwargs)
+		_local.active = True
+		try:
+			t0 = perf_counter()
+			result = func(self, *args, **kwargs)
+			seconds = perf_counter() - t0
+		finally:
+			_local.active = False
+		n = segments(self, args, result)
+		with _lock:
+			_global.add(op, n, seconds)
+			instance_stats(self).add(op, n, seconds)
+			callbacks = tuple(_callbacks)
+		for callback in callbacks:			# outside of the lock, a callback may take its time
+			callback(op, method, n, seconds)
+		return result
+
+	return wrapper
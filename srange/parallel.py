@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# parallel.py
+#
+# $Id:    $
+# $URL: $
+#
+# Part of the "pydiffract" package
+#
+
+"""
+Run a function over the values of an srange or symrange on a pool of threads or processes,
+or run a coroutine function over the values with asyncio.
+
+This is the engine behind srange.parallel_map() and symrange.parallel_map(). The range is cut
+into chunks, each chunk is sent to the pool as a small descriptor (an srange piece, or a
+symrange with a range of positions), never as a list of values. At most max_pending chunks are
+in the pool at any time, and closing the generator (e.g. a break in the loop that consumes it)
+cancels the chunks that have not started yet.
+
+async_values() and async_map() are the asyncio versions, behind __aiter__() and amap().
+srange and symrange import this module in the methods that use it, so "import srange" does not
+load concurrent.futures, and asyncio is only imported by the async functions.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+__version__	=	"$Revision: $"
+__author__	=	"Jon Tischler, <tischler@aps.anl.gov>" +\
+				"Argonne National Laboratory"
+__date__	=	"$Date: $"
+__id__		=	"$Id: $"
+
+
+def default_chunk(total, max_chunk=65536):
+	"""
+	Return a chunk length for total values, so there are about 4 chunks for each cpu,
+	but no more than max_chunk values in any one chunk.
+	"""
+	n = 4 * (os.cpu_count() or 1)
+	return max(1, min(-(-total // n), max_chunk))
+
+
+def call_each(func, values):
+	""" Return the list [func(v) for v in values], this runs in the worker. """
+	return [func(v) for v in values]
+
+
+def call_each_index(func, seq, positions):
+	""" Return the list [func(seq[n]) for n in positions], this runs in the worker. """
+	return [func(seq[n]) for n in positions]
+
+
+def chunk_map(tasks, executor=None, ordered=True, max_pending=None, max_workers=None):
+	"""
+	Generator that submits each task, a tuple (function, arg1, arg2, ...) that returns a list,
+	to a pool and yields the items of the returned lists.
+
+	executor is a concurrent.futures.Executor, or None or 'thread' for an internal ThreadPoolExecutor,
+	or 'process' for an internal ProcessPoolExecutor, both with max_workers workers.
+	An internal pool is shut down when the generator finishes or is closed.
+	If ordered is True, the results come in the order of tasks, otherwise each task's results
+	come as soon as that task is done.
+	At most max_pending tasks are submitted but not yet yielded (default is twice the number of cpus),
+	so tasks are only taken from the iterator tasks as results are used.
+	"""
+
+	if executor is None or executor == 'thread':
+		own = pool = ThreadPoolExecutor(max_workers)
+	elif executor == 'process':
+		own = pool = ProcessPoolExecutor(max_workers)
+	else:
+		own, pool = None, executor
+	if max_pending is None:
+		max_pending = 2 * (max_workers or os.cpu_count() or 1)
+	elif max_pending < 1:
+		raise ValueError("max_pending must be positive, not %r" % (max_pending,))
+
+	pending = deque() if ordered else set()
+	try:
+		for task in tasks:
+			while len(pending) >= max_pending:	# back pressure, wait for a result before submitting more
+				for item in _next_done(pending, ordered):
+					yield item
+			future = pool.submit(*task)
+			if ordered:	pending.append(future)
+			else:		pending.add(future)
+		while pending:
+			for item in _next_done(pending, ordered):
+				yield item
+	finally:									# done, failed, or closed early, cancel whatever has not started
+		for future in pending:
+			future.cancel()
+		if own is not None:
+			own.shutdown(wait=True)
+
+
+def _next_done(pending, ordered):
+	""" Remove a finished future from pending and return its result, the oldest one if ordered. """
+	if ordered:
+		return pending.popleft().result()
+	done = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+	pending.remove(done)
+	return done.result()
+
+
+async def async_values(values):
+	"""
+	Asynchronous generator of the items of the iterator values.
+	Control is given back to the event loop after every 1024 items, so a long range does not block it.
+	"""
+	import asyncio								# only the async methods need it, it is slow to import
+	for (i, value) in enumerate(values):
+		if not i % 1024 and i:
+			await asyncio.sleep(0)
+		yield value
+
+
+async def async_map(values, coro_fn, concurrency):
+	"""
+	Asynchronous generator of the results of await coro_fn(value), for each of the items of the iterator values, in order.
+	A window of at most concurrency tasks are running at any time, and values are only taken from the iterator
+	as the window has room, so the range is never expanded. When the generator is closed (use aclose(),
+	or contextlib.aclosing()) or a coroutine raises an exception, the tasks still in the window are cancelled.
+	"""
+	import asyncio
+	if concurrency < 1:
+		raise ValueError("concurrency must be positive, not %r" % (concurrency,))
+	window = deque()
+	try:
+		for value in values:
+			if len(window) >= concurrency:		# window is full, wait for the oldest task
+				yield await window.popleft()
+			window.append(asyncio.ensure_future(coro_fn(value)))
+		while window:
+			yield await window.popleft()
+	finally:
+		for task in window:
+			task.cancel()
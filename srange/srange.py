@@ -8,7 +8,19 @@
 # Part of the "pydiffract" package
 #
 
+import re
 import sys
+import mmap
+import heapq
+import struct
+import itertools
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from bisect import bisect_left, bisect_right
+from math import gcd
+
+from . import instrument
 
 __version__	=	"$Revision: $"
 __author__	=	"Jon Tischler, <tischler@aps.anl.gov>" +\
@@ -18,12 +30,131 @@ __date__	=	"$Date: $"
 __id__		=	"$Id: $"
 
 
-class srange:
+_CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+def _column(values):
+	"""
+	Return the list of integers values as an array('q') of 64 bit integers,
+	or as a list when some value does not fit in 64 bits (python integers have no limit).
+	"""
+	try:	return array('q', values)
+	except OverflowError:	return list(values)
+
+
+def _put_varint(out, n):
+	""" Append the non-negative integer n to the bytearray out as a varint, 7 bits per byte, low bits first. """
+	while n > 0x7f:
+		out.append((n & 0x7f) | 0x80)
+		n >>= 7
+	out.append(n)
+
+
+def _get_varint(data, pos):
+	""" Return (n, pos) for the varint in data starting at pos, pos is moved past it. """
+	n = shift = 0
+	try:
+		while True:
+			b = data[pos]
+			pos += 1
+			n |= (b & 0x7f) << shift
+			if b < 0x80:
+				return (n, pos)
+			shift += 7
+	except IndexError:
+		raise ValueError("srange byte string is truncated.")
+
+
+_BYTES_MAGIC = b'SR'					# first bytes of every to_bytes() string
+_BYTES_VERSION = 1						# version of the to_bytes() format
+
+# One simple range of the usual range strings, e.g. " 1-10:2", " -5" or "-inf--3", followed by a comma or the end.
+# lo & hi are integers or [-]inf, the stride is a positive integer. Any other character is caught by the last group,
+# so findall() goes through the whole string in one pass, see __scan_string().
+_SIMPLE_RANGE = re.compile(r'\s*(-?(?:[0-9]+|inf))\s*(?:-\s*(-?(?:[0-9]+|inf))\s*(?::\s*([1-9][0-9]*)\s*)?)?(?:,|\Z)|(.)',
+	re.IGNORECASE | re.DOTALL)
+
+_COMPACTIONS = ('greedy', 'optimal')	# the compaction modes of srange(r, compaction=...)
+
+_FILE_HEADER = struct.Struct('=4sHHQ')	# magic, version, flags, number of simple ranges
+_FILE_MAGIC = b'SRCM'					# first bytes of every to_file() file
+_FILE_VERSION = 1						# version of the to_file() format
+_FILE_HAS_COUNTS = 1					# flag, the counts column is in the file
+
+
+def _splice(column, i, j, values):
+	"""
+	Return a new column with column[i:j] replaced by the list of integers values, column itself is not changed.
+	For array('q') columns the copy is done by array slicing and concatenation, and for the memoryview
+	of a mapped file (open_file()) the bytes are copied into an array('q').
+	"""
+	new = _column(values)
+	if isinstance(column, array) and isinstance(new, array):
+		return column[:i] + new + column[j:]
+	if isinstance(column, memoryview) and isinstance(new, array):
+		out = array('q')
+		out.frombytes(column[:i].cast('B'))
+		out.extend(new)
+		out.frombytes(column[j:].cast('B'))
+		return out
+	return _column(list(column[:i]) + list(values) + list(column[j:]))
+
+
+def _inverse(a, m):
+	"""
+	Return the inverse of a modulo m (a and m coprime, m > 1), by the extended Euclidean algorithm.
+	This is pow(a, -1, m), which needs python 3.8.
+	"""
+	(r0, r1, x0, x1) = (a % m, m, 1, 0)
+	while r1:
+		q = r0 // r1
+		(r0, r1, x0, x1) = (r1, r0 - q*r1, x1, x0 - q*x1)
+	return x0 % m
+
+
+def _splice_counts(counts, i, j, middle, delta):
+	"""
+	Return a new counts column (from __index_tables()) with counts[i+1:j+1] replaced by the list middle
+	and delta added to each of the counts after them, counts itself is not changed.
+	The tail is shifted by numpy on an array('q') copy, so no python object is made for each count.
+	Return None (the counts are made again when needed) if numpy is missing or the counts do not fit in 64 bits.
+	"""
+	if not isinstance(counts, (array, memoryview)):
+		return None
+	try:
+		np = _numpy()
+		head = array('q', middle)
+	except (ImportError, OverflowError):
+		return None
+	(new, tail) = (array('q'), array('q'))
+	view = memoryview(counts)					# an array('q'), or a mapped file from open_file()
+	new.frombytes(view[:i+1].cast('B'))
+	tail.frombytes(view[j+1:].cast('B'))
+	if tail and tail[-1] + delta > sys.maxsize:
+		return None
+	np.frombuffer(tail, dtype=np.int64)[:] += delta
+	return new + head + tail
+
+
+def _numpy():
+	"""
+	Return the numpy module.
+	numpy is optional, it is only imported when a method that returns numpy arrays is first used.
+	"""
+	try:
+		import numpy
+	except ImportError:
+		raise ImportError("numpy is required for this method, but it could not be imported")
+	return numpy
+
+
+class srange(object):
 	"""
 	String-range class.
 
 
-	Updated to work with both python 2 & 3 (previously only 2) by JZT on June 12, 2020.
+	Converted from python 2 to python 3 by JZT on June 12, 2020, python 3.6 or later is needed
+	(the asyncio support uses asynchronous generators).
 	Also a suite of tests are included at the end.
 	with conversion to python3, also had to deal with i/j --> float, not int
 
@@ -59,47 +190,102 @@ class srange:
 	======================= ===================================================================================
 	variables of interest     description
 	======================= ===================================================================================
-	self.r                  the input string, after formatting and compacting
+	self.r                  the input string, after formatting and compacting, it is only made when first needed
+	self.l                  list of simple ranges, tuples of (lo,hi,stride), made from the lo, hi & stride columns when asked for
 	self.previous_item      the previous value produced, initially set very low
-	self.auto_reset         if True (default), then previous_item is reset to min at each call to __iter__
+	self.auto_reset         if True (default), each __iter__ returns a new srange_iterator, if False iteration continues from previous_item
 	======================= ===================================================================================
 
 	======================= ===================================================================================
 	methods of interest        action
 	======================= ===================================================================================
 	next()                  returns next value, updates previous_item too
-	reset_previous()        reset the iterator so it starts with the first value
+	reset_previous()        reset the iterator so it starts with the first value, reset_previous(end=True) to start prev() at the end
 	after(prev)             returns value that follows prev, without changing the current point in iteration
+	prev()                  returns the value before previous_item, updates previous_item too, next() going backwards
+	before(val)             returns value that comes before val, without changing the current point in iteration
 	first()                 returns the first number in the range, for self.r="3,5,9-20", self.first() returns 3
 	last()                  returns the last number in the range, for self.r="3,5,9-20", self.last() returns 20
 	len()                   returns number of points in the range, for self.r="3,5,9-20", self.len() returns 14
+	segment_count()         returns number of simple ranges, srange(r, compaction='optimal') makes the fewest possible
 	is_in_range(m)          returns True if m is in self.r, otherwise False
+	contains_many(values)   returns a numpy boolean mask, True where the value is in the range (needs numpy)
 	index(ipnt)             return the ipntth number from range, first number is ipnt==0,  returns None if ipnt negative or too big
 	val2index(m)            returns index into r that corresponds to m. e.g. for r='3,5,9-20', m=5 returns 1.
+	index_many(ipnts)       vectorized index(), returns a numpy array of values at the positions ipnts (needs numpy)
+	val2index_many(values)  vectorized val2index(), returns a numpy array of indices, missing values get -1 (needs numpy)
+	floor_many(values)      numpy array of the largest value in the range <= each value (needs numpy)
+	ceil_many(values)       numpy array of the smallest value in the range >= each value (needs numpy)
+	nearest_many(values)    numpy array of the value in the range nearest to each value (needs numpy)
 	sub_range(start,n,...)  returns a new range that is a sub range of current one, setLast=False
+	sub_srange(start,n,...) same as sub_range(), but returns an srange instead of a string
+	split(n_parts)          returns a list of n_parts sranges, with nearly equal numbers of values
+	split_by(chunk_len)     returns a list of sranges, each with chunk_len values (the last may have fewer)
+	parallel_map(func,...)  generator of func(value) for each value, run on a thread or process pool in chunks
+	parallel_for(func,...)  call func(value) for each value on a thread or process pool, discard the results
+	amap(coro_fn,...)       async generator of await coro_fn(value) for each value, with bounded concurrency
 	list(self)              returns a list where each element is a value in the range, CAUTION this can make a VERY big list
+	to_array(dtype,out)     returns a numpy array of all values in the range (needs numpy), there is no 1e7 limit as in list()
+	iter_chunks(size,...)   generator of consecutive blocks of up to size values, as numpy arrays or as lists of range objects
+	set_cache_size(n)       class method, keep up to n parsed range strings in a shared LRU cache, 0 (default) is off
+	cache_info()            class method, returns the hits, misses, evictions, maxsize & currsize of the parse cache
+	set_stats(enabled)      class method, turn on counting of calls, simple ranges visited & time for parse, compact, iterate, index & lookup
+	stats_info()            class method, returns the counts over all sranges, stats() returns the counts for one srange
+	add_stats_callback(f)   class method, f(op, method, segments, seconds) is called after each counted call
+	to_bytes()              returns the simple ranges as a compact byte string, also used for pickling
+	from_bytes(data)        class method, returns a new srange from the output of to_bytes()
+	to_file(path)           write the simple ranges to a file as flat binary columns
+	open_file(path)         class method, returns an srange that reads its columns from the file through mmap, no load step
+	parse_many(strings)     class method, returns a list of sranges, one for each range string, repeated strings are parsed once
+	from_array(arr)         class method, returns a new srange from an array of integers, like srange(arr) but vectorized (needs numpy)
+	issubset(other)         True if all values are also in other, issuperset(other) & isdisjoint(other) also
+	add(value)              add value to the range in place, discard(value) removes it
+	add_range(lo,hi,stride) add the simple range lo-hi:stride in place, discard_range(lo,hi,stride) removes it
+	union(other)            returns a new srange with the values in either range, same as self | other
+	intersection(other)     returns a new srange with the values in both ranges, same as self & other
+	difference(other)       returns a new srange with the values in self but not in other, same as self - other
+	symmetric_difference(o) returns a new srange with the values in exactly one of the ranges, same as self ^ other
 	======================= ===================================================================================
 
 	=====================   ======================= ===================================================================
 	special methods          command                    result using: sr = srange('1-4')
 	=====================   ======================= ===================================================================
 	__getitem__(n)          print (sr[2])               3
+	__getitem__(slice)      print (sr[1:3])             2-3
+	__reversed__()          print (list(reversed(sr)))  [4, 3, 2, 1]
+	__aiter__()             async for i in sr: ...      1, 2, 3, 4
 	__len__()               print (len(sr))             4
 	__str__()               print (str(sr))             1-4
 	__repr__()              print (repr(sr))            srange('1-4', len=4, previous=0, auto_reset=True)
+	__or__(other)           print (sr | srange('6'))    1-4,6
+	__and__(other)          print (sr & srange('3-9'))  3-4
+	__sub__(other)          print (sr - srange('2'))    1,3-4
+	__xor__(other)          print (sr ^ srange('3-5'))  1-2,5
+	__eq__(other)           print (sr == srange('1-4')) True, equal sranges have equal hashes
+	__le__(other)           print (sr <= srange('0-9')) True, also <, >= & >, subset and superset
 	=====================   ======================= ===================================================================
 	"""
 
-	def __init__(self, r='', auto_reset=True):
+	# The simple ranges are stored as three columns (lo, hi & stride), each an array('q') of 64 bit integers
+	# (a list if a value does not fit, or a memoryview of a mapped file for open_file()).
+	# With __slots__ there is no instance __dict__, so many small sranges take little memory.
+	__slots__ = ('__lo', '__hi', '__stride', '__r', '__counts', '__length', '__columns', '__cursor', '__hash',
+		'__stats', 'auto_reset', 'previous_item')
+
+	intTypes = (int,)
+	MAXINT = sys.maxsize						# = (2^63)-1
+
+	def __init__(self, r='', auto_reset=True, compaction='greedy'):
 		"""
 		Initialize the srange instance.
+		compaction is 'greedy' (default, fast) or 'optimal' (the fewest simple ranges, see __compact_optimal()).
 		"""
-		try:	self.intTypes = (int, long)		# long is only in python2, not 3
-		except:	self.intTypes = (int)
-		try:	self.MAXINT = sys.maxint		# sys.maxint only exists in python2
-		except:	self.MAXINT = sys.maxsize		# for python3, maxsize is a good choice, = (2^63)-1
+		if compaction not in _COMPACTIONS:
+			raise ValueError("compaction must be one of %r, not %r" % (_COMPACTIONS, compaction))
 
 		# if a numpy array is passed for r, convert r to an integer array
+		# numpy is not imported here, anyone passing a numpy array has already imported it
+		numpy = sys.modules.get('numpy')
 		try:
 			if isinstance(r[0], numpy.integer):
 				r_int = []						# a new empty array
@@ -109,39 +295,572 @@ class srange:
 		except:	pass
 
 		# convert input to a list of tuples, each tuple is one simple dash range, e.g. "1-17:2"
-		try:
-			if isinstance(r, unicode): r = r.encode()	# convert any unicode to str
-		except:	pass
+		cached = None							# (lo, hi, stride) columns from the parse cache
+		key = None								# key of this string in the parse cache
 		if isinstance(r,str):
 			if r.lower() == 'none': r = ''		# 'none' is same as empty string
-			self.l = self.__string_to_tuple_list(r)
+			if r.strip():						# the empty range is not worth a place in the parse cache
+				key = r.strip() if compaction == 'greedy' else (r.strip(), compaction)
+				cached = self.__cache_get(key)
+			if cached is None:
+				l = self.__string_to_tuple_list(r)
 		elif isinstance(r, self.intTypes):
 			r = int(r)
-			self.l = [(r,r,1)]
+			l = [(r,r,1)]
 			r = str(r)
 		elif hasattr(r, '__iter__'):			# this works for list and numpy.array, fails for strings
-			self.l = self.__list_to_srange(r)
+			l = self.__list_to_srange(r)
 		else:
 			raise TypeError("String list must be a string or (list of) integers.")
 
-		if not self.__is_monotonic():
-			self.__resort_list()				# try to sort the list to be monotonic
-			if not self.__is_monotonic():		# if still not monotonic, give up
+		if cached is None and not self.__is_monotonic(l):
+			l = self.__resort_list(l)			# try to sort the list to be monotonic
+			if not self.__is_monotonic(l):		# if still not monotonic, give up
 				raise ValueError("String range is unsortable.")
 
 		try:	self.auto_reset = bool(auto_reset)
 		except:	raise TypeError("auto_reset must be boolean")
 
+		if cached is None:
+			# compactify the list, the string self.r is made when needed
+			self.l = self.__compact(l) if compaction == 'greedy' else self.__compact_optimal(l)
+			if key is not None:
+				self.__cache_put(key)
+		else:
+			self.__set_columns(*[c[:] for c in cached])	# each srange gets its own copy of the shared columns
 		self.reset_previous()					# set self.previous_item to number before first number in range
-		self.l = self.__compact(self.l)			# compactify the list
-		self.r = self.__tuple_list_to_str(self.l)	# make a string representation of list
+
+	# The parse cache, shared by all sranges, it maps a range string to its (lo, hi, stride) columns after compacting.
+	# It is off (size 0) until set_cache_size() is called.
+	_cache = OrderedDict()
+	_cache_lock = threading.Lock()
+	_cache_maxsize = 0
+	_cache_hits = 0
+	_cache_misses = 0
+	_cache_evictions = 0
+
+	@classmethod
+	def set_cache_size(cls, maxsize):
+		"""
+		Set the maximum number of range strings kept in the parse cache, 0 turns the cache off.
+		When the cache is on, making an srange from a string that was seen recently skips parsing
+		and compacting. The least recently used strings are evicted first.
+
+		EXAMPLE::
+			>>> srange.set_cache_size(1000)
+			>>> a = srange("1-1000:2,2001-3000")	# parsed
+			>>> b = srange("1-1000:2,2001-3000")	# from the cache
+			>>> print (srange.cache_info())
+			CacheInfo(hits=1, misses=1, evictions=0, maxsize=1000, currsize=1)
+		"""
+		try:	maxsize = int(maxsize)
+		except:	raise TypeError("maxsize must be an integer, not %r" % (maxsize,))
+		if maxsize < 0:
+			raise ValueError("maxsize must be >= 0, not %r" % maxsize)
+		with srange._cache_lock:
+			srange._cache_maxsize = maxsize
+			while len(srange._cache) > maxsize:
+				srange._cache.popitem(last=False)
+				srange._cache_evictions += 1
+
+	@classmethod
+	def cache_info(cls):
+		""" Return the named tuple CacheInfo(hits, misses, evictions, maxsize, currsize) for the parse cache. """
+		with srange._cache_lock:
+			return _CacheInfo(srange._cache_hits, srange._cache_misses, srange._cache_evictions,
+				srange._cache_maxsize, len(srange._cache))
+
+	@classmethod
+	def cache_clear(cls):
+		""" Empty the parse cache and reset its counters, the size is not changed. """
+		with srange._cache_lock:
+			srange._cache.clear()
+			srange._cache_hits = srange._cache_misses = srange._cache_evictions = 0
+
+	def __cache_get(self, key):
+		"""
+		Return the cached (lo, hi, stride) columns for the range string key, or None if it is not in the parse cache.
+		For compaction other than 'greedy' the key is the tuple (range string, compaction).
+		"""
+		if not srange._cache_maxsize:
+			return None
+		with srange._cache_lock:
+			cached = srange._cache.get(key)
+			if cached is None:
+				srange._cache_misses += 1
+			else:
+				srange._cache_hits += 1
+				srange._cache.move_to_end(key)
+			return cached
+
+	def __cache_put(self, key):
+		""" Put a copy of the columns of this srange into the parse cache, the cached columns are never changed. """
+		if not srange._cache_maxsize:
+			return
+		with srange._cache_lock:
+			srange._cache[key] = (self.__lo[:], self.__hi[:], self.__stride[:])
+			srange._cache.move_to_end(key)
+			while len(srange._cache) > srange._cache_maxsize:
+				srange._cache.popitem(last=False)
+				srange._cache_evictions += 1
+
+	@classmethod
+	def set_stats(cls, enabled):
+		"""
+		Turn the instrumentation on or off, it is off by default and then costs nothing.
+		While it is on, the number of calls, simple ranges visited and seconds spent are added up for
+		the operations parse, compact, iterate, index and lookup, for each srange and over all sranges.
+		The results of the methods do not change. Only the calls made from outside are counted, not the
+		instrumented methods they use in turn (e.g. sr[3] is one index call). Iteration with "for i in sr"
+		is counted when the iterator is made, the loop itself runs without python calls and is not timed.
+
+		EXAMPLE::
+			>>> srange.set_stats(True)
+			>>> sr = srange("1-1000:2,2001-3000")
+			>>> n = sr.index(700)
+			>>> print (srange.stats_info()['index'])
+			OpStats(calls=1, segments=1, seconds=...)
+		"""
+		if not enabled:
+			instrument.disable(srange)
+			return
+		scan = lambda self, args, result: len(self.__lo)	# visits all of the simple ranges
+		one = lambda self, args, result: 1					# a binary search finds the one simple range
+		methods = {'_srange__string_to_tuple_list': ('parse', lambda self, args, result: len(result)),
+			'_srange__list_to_srange': ('parse', lambda self, args, result: len(result)),
+			'_srange__compact': ('compact', lambda self, args, result: len(args[0] or ())),
+			'_srange__compact_optimal': ('compact', lambda self, args, result: len(args[0] or ())),
+			'index': ('index', one), 'val2index': ('index', one), '__getitem__': ('index', one),
+			'index_many': ('index', scan), 'val2index_many': ('index', scan), 'sub_srange': ('index', scan),
+			'is_in_range': ('lookup', one), 'contains_many': ('lookup', scan),
+			'floor_many': ('lookup', scan), 'ceil_many': ('lookup', scan), 'nearest_many': ('lookup', scan)}
+		for name in ('next', 'prev', 'after', 'before'):
+			methods[name] = ('iterate', one)
+		for name in ('__iter__', '__reversed__', 'list', 'to_array', 'iter_chunks'):
+			methods[name] = ('iterate', scan)
+		instrument.enable(srange, methods, srange.__instance_stats)
+
+	@classmethod
+	def stats_info(cls):
+		""" Return a dict of operation -> OpStats(calls, segments, seconds), the totals over all sranges. """
+		return instrument.global_stats()
+
+	@classmethod
+	def stats_clear(cls):
+		""" Set the totals over all sranges back to zero, the totals of each srange are kept. """
+		instrument.clear()
+
+	@classmethod
+	def add_stats_callback(cls, callback):
+		"""
+		Register callback(op, method, segments, seconds), it is called after each instrumented call,
+		e.g. to forward the numbers to a metrics system. It is only called while set_stats(True).
+		"""
+		instrument.add_callback(callback)
+
+	@classmethod
+	def remove_stats_callback(cls, callback):
+		""" Unregister a callback given to add_stats_callback(). """
+		instrument.remove_callback(callback)
+
+	def stats(self):
+		""" Return a dict of operation -> OpStats(calls, segments, seconds), the totals for this srange. """
+		try:	stats = self.__stats
+		except AttributeError:
+			return instrument.Stats().snapshot()	# never instrumented, all zero
+		return stats.snapshot()
+
+	def __instance_stats(self):
+		""" Return the instrument.Stats of this srange, made on first use. """
+		try:	return self.__stats
+		except AttributeError:
+			self.__stats = instrument.Stats()
+			return self.__stats
+
+	@property
+	def l(self):
+		""" The list of simple ranges, each one a tuple (lo,hi,stride), None for an empty range. """
+		return list(zip(self.__lo, self.__hi, self.__stride)) or None
+
+	@l.setter
+	def l(self, l):
+		""" Set the list of simple ranges, this also invalidates the cached index tables and string. """
+		l = l or []
+		self.__set_columns(_column([t[0] for t in l]), _column([t[1] for t in l]), _column([t[2] for t in l]))
+
+	def __set_columns(self, lo, hi, stride):
+		""" Set the lo, hi & stride columns, and invalidate everything that was made from them. """
+		self.__lo, self.__hi, self.__stride = lo, hi, stride
+		self.__r = None							# string, made by the r property
+		self.__counts = None					# counts[i] is number of values before simple range i
+		self.__length = None					# total number of values, kept by __update() even without counts
+		self.__cursor = (None, 0)				# (previous_item, index of its simple range), used by next()
+		self.__columns = None					# numpy versions of the columns, built by __numpy_columns()
+		self.__hash = None						# hash of the canonical simple ranges, made by __hash__()
+
+	@property
+	def r(self):
+		""" The string form of the range, after formatting and compacting. It is made on first use. """
+		if self.__r is None:
+			self.__r = self.__tuple_list_to_str(self.l)
+		return self.__r
+
+	@r.setter
+	def r(self, r):
+		self.__r = r
+
+	def _segments(self, reverse=False):
+		""" Return an iterator of the simple ranges (lo,hi,stride), without making the list self.l """
+		if reverse:
+			return zip(reversed(self.__lo), reversed(self.__hi), reversed(self.__stride))
+		return zip(self.__lo, self.__hi, self.__stride)
+
+	def __window(self, lo, hi, margin=0):
+		"""
+		Return (i, j), where the simple ranges i to j-1 are those that can hold values in [lo,hi],
+		found by binary searches of the hi & lo columns, with margin more simple ranges on each side.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+		"""
+		i = max(bisect_left(self.__hi, lo) - margin, 0)
+		j = min(bisect_right(self.__lo, hi) + margin, len(self.__lo))
+		return (i, j)
+
+	def __segment_list(self, i, j):
+		""" Return the list of the simple ranges i to j-1, only these are read from the columns. """
+		return list(zip(self.__lo[i:j], self.__hi[i:j], self.__stride[i:j]))
+
+	def __overlap(self, other):
+		"""
+		Return (l1, l2), the lists of the simple ranges of self within the span of other, and of other within
+		the span of self. Only values in these can be in both, the rest of a large range (e.g. a mapped file) is not read.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+		"""
+		if not self.__lo or not other.__lo:
+			return ([], [])
+		return (self.__segment_list(*self.__window(other.__lo[0], other.__hi[-1])),
+			other.__segment_list(*other.__window(self.__lo[0], self.__hi[-1])))
+
+	def __index_tables(self):
+		"""
+		Return the tuple (los, counts) used for binary searches of the simple ranges.
+		los[i] is the lo value of the i-th simple range (the lo column itself), and counts[i] is the number
+		of values preceding the i-th simple range, so counts[-1] is the total number of values (len(counts)==len(los)+1).
+		counts is an array('q'), or a list when the total does not fit in 64 bits, e.g. "-inf-inf".
+		counts is built once and cached until the simple ranges are changed, __update() shifts it in place of that.
+		"""
+		if self.__counts is None:
+			counts = [0]
+			total = 0
+			for (lo, hi, stride) in self._segments():
+				total += (hi-lo)//stride + 1
+				counts.append(total)
+			self.__counts = _column(counts)
+		return self.__lo, self.__counts
+
+	def __numpy_columns(self, np):
+		"""
+		Return the tuple (lo, hi, stride) of numpy int64 arrays, used for vectorized searches.
+		They share memory with the array('q') (or mapped file) columns.
+		The arrays are built once and cached until the simple ranges are changed.
+		"""
+		if self.__columns is None:
+			self.__columns = [np.frombuffer(c, dtype=np.int64) if isinstance(c, (array, memoryview))
+				else np.array(c, dtype=np.int64) for c in (self.__lo, self.__hi, self.__stride)] + [None]
+		return tuple(self.__columns[:3])
+
+	def __numpy_counts(self, np):
+		"""
+		Return the counts of __index_tables() as a numpy uint64 array, only index_many() & val2index_many() need it.
+		uint64 is used since a range can have more than 2**63 values, e.g. "0-inf" or "-inf-inf".
+		An OverflowError is raised if the range has 2**64 values or more. The array is cached with the columns.
+		"""
+		self.__numpy_columns(np)
+		if self.__columns[3] is None:
+			counts = self.__index_tables()[1]
+			if isinstance(counts, (array, memoryview)):	# the counts fit in int64
+				counts = np.frombuffer(counts, dtype=np.int64).view(np.uint64)
+			elif counts[-1] >= 2**64:
+				raise OverflowError("The range has %d values, too many for positions in a numpy array." % counts[-1])
+			else:
+				counts = np.array(counts, dtype=np.uint64)
+			self.__columns[3] = counts
+		return self.__columns[3]
+
+	def to_bytes(self):
+		"""
+		Return the simple ranges as a compact, versioned byte string, the inverse of from_bytes().
+		The format is b'SR', a version byte, the number of simple ranges as a varint, then for each
+		simple range: the gap from the previous hi (the first lo zig-zag encoded instead), the number
+		of steps (hi-lo)/stride and the stride, all as varints. auto_reset and previous_item are not stored.
+
+		EXAMPLE::
+			>>> b = srange("1-1000:2,2001-3000").to_bytes()
+			>>> print (len(b), srange.from_bytes(b))
+			13 1-999:2,2001-3000
+		"""
+		out = bytearray(_BYTES_MAGIC)
+		out.append(_BYTES_VERSION)
+		_put_varint(out, len(self.__lo))
+		previous = None
+		for (lo, hi, stride) in self._segments():
+			if previous is None:
+				_put_varint(out, 2*lo if lo >= 0 else -2*lo-1)	# zig-zag, the first lo may be negative
+			else:
+				_put_varint(out, lo - previous - 1)			# simple ranges are increasing, so this is >= 0
+			_put_varint(out, (hi-lo) // stride)
+			_put_varint(out, stride)
+			previous = hi
+		return bytes(out)
+
+	@classmethod
+	def from_bytes(cls, data, auto_reset=True):
+		"""
+		Return a new srange from a byte string made by to_bytes().
+		There is no parsing or compacting, the columns are filled directly.
+		"""
+		data = memoryview(data).cast('B')
+		if bytes(data[:2]) != _BYTES_MAGIC or len(data) < 3:
+			raise ValueError("Not an srange byte string.")
+		if data[2] != _BYTES_VERSION:
+			raise ValueError("Unsupported srange byte string version %d, expected %d." % (data[2], _BYTES_VERSION))
+		(k, pos) = _get_varint(data, 3)
+		(los, his, strides) = ([], [], [])
+		previous = None
+		for i in range(k):
+			(v, pos) = _get_varint(data, pos)
+			if previous is None:
+				lo = v >> 1 if not v & 1 else -((v+1) >> 1)
+			else:
+				lo = previous + 1 + v
+			(steps, pos) = _get_varint(data, pos)
+			(stride, pos) = _get_varint(data, pos)
+			if stride <= 0:
+				raise ValueError("stride is not a positive integer in srange byte string.")
+			previous = lo + steps*stride
+			los.append(lo)
+			his.append(previous)
+			strides.append(stride)
+		if pos != len(data):
+			raise ValueError("Extra bytes at the end of srange byte string.")
+		sr = cls._empty(auto_reset)
+		sr.__set_columns(_column(los), _column(his), _column(strides))
+		sr.reset_previous()
+		return sr
+
+	def to_file(self, path):
+		"""
+		Write the simple ranges to the file path as flat binary columns, open it again with open_file().
+		The file is a 16 byte header (b'SRCM', the format version, flags and the number of simple ranges k),
+		then the lo, hi & stride columns of k 64 bit integers and the k+1 counts used by index() & val2index(),
+		in the byte order of this machine. The counts are left out when the total length does not fit in 64 bits.
+		"""
+		try:	columns = [array('q', c) for c in (self.__lo, self.__hi, self.__stride)]
+		except OverflowError:
+			raise ValueError("Values do not fit in 64 bits, the range can not be written to a file.")
+		flags = _FILE_HAS_COUNTS
+		try:	counts = array('q', self.__index_tables()[1])
+		except OverflowError:
+			(flags, counts) = (0, array('q'))	# e.g. "-inf-inf", the counts are made again after opening
+		with open(path, 'wb') as f:
+			f.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, flags, len(columns[0])))
+			for c in columns + [counts]:
+				f.write(c.tobytes())
+
+	@classmethod
+	def open_file(cls, path, auto_reset=True):
+		"""
+		Return a new srange whose columns are the file path written by to_file(), mapped read only with mmap.
+		Nothing is read, parsed or compacted when opening, lookups, iteration & set operations read
+		the mapped pages directly, and all processes that open the same file share those pages.
+		The file must not be changed while it is open. Methods that return a new srange return an ordinary one.
+
+		EXAMPLE::
+			>>> srange("1-1000:2,2001-3000").to_file('frames.src')
+			>>> sr = srange.open_file('frames.src')
+			>>> print (sr.index(600), sr.is_in_range(2500))
+			2101 True
+		"""
+		with open(path, 'rb') as f:
+			try:	mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except ValueError:					# an empty file can not be mapped
+				raise ValueError("%r is not an srange file." % (path,))
+		if len(mapped) < _FILE_HEADER.size:
+			raise ValueError("%r is not an srange file." % (path,))
+		(magic, version, flags, k) = _FILE_HEADER.unpack(mapped[:_FILE_HEADER.size])
+		if magic != _FILE_MAGIC:
+			raise ValueError("%r is not an srange file." % (path,))
+		if version != _FILE_VERSION:
+			if version == _FILE_VERSION << 8:
+				raise ValueError("%r was written on a machine with the other byte order." % (path,))
+			raise ValueError("Unsupported srange file version %d, expected %d." % (version, _FILE_VERSION))
+		n_counts = k+1 if flags & _FILE_HAS_COUNTS else 0
+		if len(mapped) != _FILE_HEADER.size + 8*(3*k + n_counts):
+			raise ValueError("%r has the wrong size for %d simple ranges." % (path, k))
+
+		view = memoryview(mapped)[_FILE_HEADER.size:].cast('q')
+		sr = cls._empty(auto_reset)
+		sr.__set_columns(view[:k], view[k:2*k], view[2*k:3*k])
+		if n_counts:
+			sr.__counts = view[3*k:]
+		sr.reset_previous()
+		return sr
+
+	def __reduce__(self):
+		""" Pickle as to_bytes(), so unpickling fills the columns without parsing or compacting. """
+		return (type(self).from_bytes, (self.to_bytes(), self.auto_reset), (None, {'previous_item': self.previous_item}))
+
+	@classmethod
+	def parse_many(cls, strings, auto_reset=True, compaction='greedy'):
+		"""
+		Return a list of new sranges, one for each of the range strings in strings, e.g. a column of a spreadsheet.
+		Each distinct string is parsed and compacted only once, the sranges of repeated strings get a copy of its columns.
+
+		EXAMPLE::
+			>>> print ([str(sr) for sr in srange.parse_many(["1-5", "2,4,6", "1-5"])])
+			['1-5', '2-6:2', '1-5']
+		"""
+		parsed = {}								# string -> srange of its first occurrence
+		out = []
+		for r in strings:
+			first = parsed.get(r)
+			if first is None:
+				sr = parsed[r] = cls(r, auto_reset=auto_reset, compaction=compaction)
+			else:
+				sr = cls._empty(auto_reset)
+				sr.__set_columns(first.__lo[:], first.__hi[:], first.__stride[:])
+				sr.reset_previous()
+			out.append(sr)
+		return out
+
+	@classmethod
+	def _empty(cls, auto_reset=True):
+		"""
+		Return a new empty srange without going through __init__(), so there is no parsing,
+		no use of the parse cache and nothing is counted by the instrumentation.
+		This is used to make new sranges that get their simple ranges directly.
+		"""
+		sr = cls.__new__(cls)
+		sr.auto_reset = bool(auto_reset)
+		sr.__set_columns(_column([]), _column([]), _column([]))
+		sr.reset_previous()
+		return sr
+
+	@classmethod
+	def _from_tuple_list(cls, l, auto_reset=True, compact=True):
+		"""
+		Return a new srange made from l, a monotonic list of simple ranges, tuples of the form (lo,hi,stride).
+		l is compacted (unless compact is False) but not checked,
+		this is used to make new sranges without going through a string.
+		"""
+		sr = cls._empty(auto_reset)
+		sr.l = sr.__compact(l) if compact else l
+		sr.reset_previous()
+		return sr
+
+	@classmethod
+	def from_array(cls, arr, assume_sorted=False, auto_reset=True, compaction='greedy'):
+		"""
+		Return a new srange holding the values in arr, an array (or list) of integers, numpy must be available.
+		This gives the same srange as srange(arr), but runs of values with a constant stride are found
+		with numpy.diff(), so no python object is made for each value, only one for each simple range.
+		If assume_sorted is True, arr must already be increasing, and it is not sorted again.
+		Repeated values raise a ValueError, as for srange(arr), and so do unsigned values above the int64 maximum.
+		compaction is as for srange().
+
+		EXAMPLE::
+			>>> print (srange.from_array(numpy.array([9, 1, 3, 5, 7, 10, 11, 12])))
+			1-9:2,10-12
+		"""
+
+		if compaction not in _COMPACTIONS:
+			raise ValueError("compaction must be one of %r, not %r" % (_COMPACTIONS, compaction))
+		np = _numpy()
+		v = np.asarray(arr)
+		if v.size and v.dtype.kind not in 'iu':
+			raise ValueError("List elements must be integers.")
+		if v.size and v.dtype.kind == 'u' and v.max() > np.iinfo(np.int64).max:
+			raise ValueError("List elements must fit in int64, the largest is %d." % v.max())
+		v = v.astype(np.int64).ravel() if assume_sorted else np.sort(v.astype(np.int64), axis=None)
+		if v.size == 0:
+			return cls._empty(auto_reset)
+
+		d = np.diff(v)
+		if d.size and d.min() <= 0:
+			raise ValueError("String range is unsortable.")
+
+		# Find the runs of singles that __compact() would combine, by running its first step
+		# once for each block of equal differences, instead of once for each value.
+		# A block starting at d[b] with m equal differences covers the values v[b], ..., v[b+m].
+		starts = np.flatnonzero(np.diff(d)) + 1
+		starts = np.concatenate(([0], starts)) if d.size else starts
+		lengths = np.diff(np.concatenate((starts, [d.size])))
+		lcombine = []							# (first index, last index, stride) of each run
+		count, istart, stride = 1, 0, 0
+		for (b, m, diff) in zip(starts.tolist(), lengths.tolist(), d[starts].tolist()):
+			if count == 1:						# the run from v[b] continues through the whole block
+				count, stride = 1 + m, diff
+				continue
+			if count > 2:						# done with this run, save info
+				lcombine.append((istart, b, stride))
+			count, istart = 1, b+1				# start again at v[b+1], the first value in the block
+			if m > 1:
+				count, stride = m, diff
+		if count > 2:
+			lcombine.append((istart, v.size-1, stride))
+
+		ltemp = []
+		i0 = 0									# next value to do
+		for (lc0, lc1, stride) in lcombine:		# values between runs are single value simple ranges
+			ltemp.extend((x, x, 1) for x in v[i0:lc0].tolist())
+			ltemp.append((int(v[lc0]), int(v[lc1]), stride))
+			i0 = lc1+1
+		ltemp.extend((x, x, 1) for x in v[i0:].tolist())
+
+		sr = cls._empty(auto_reset)
+		ltemp = sr.__join_neighbours(ltemp) if compaction == 'greedy' else sr.__compact_optimal(ltemp)
+		return cls._from_tuple_list(ltemp, auto_reset=auto_reset, compact=False)
 
 	def __iter__(self):
-		""" The class iterator """
+		"""
+		The class iterator.
+		When auto_reset is True, this returns a new srange_iterator that starts at the first value and
+		has its own position, so nested loops (or threads) over the same srange do not interfere.
+		previous_item is not changed by such a loop.
+		When auto_reset is False, the srange itself is returned and iteration continues from previous_item.
+		"""
 		if self.auto_reset:
-			self.reset_previous()				# reset to start of range, changed July 24-2014 JZT
+			return srange_iterator(self)
 		return self
 
+	def __aiter__(self):
+		"""
+		Return an asynchronous iterator over the values, so that "async for value in sr:" works.
+		Like __iter__ with auto_reset True, it has its own position and does not change previous_item.
+		"""
+		from . import parallel
+		return parallel.async_values(srange_iterator(self))
+
+	def amap(self, coro_fn, concurrency=8):
+		"""
+		Asynchronous generator that yields await coro_fn(value) for each value in the range, in order.
+		Up to concurrency coroutines run at the same time, in a window that moves along the range,
+		so the range is never expanded. See parallel.async_map().
+
+		EXAMPLE::
+			>>> async def fetch(frame): ...
+			>>> async for image in srange("1-1000").amap(fetch, concurrency=16):
+					process(image)
+		"""
+		from . import parallel
+		return parallel.async_map(srange_iterator(self), coro_fn, concurrency)
+
+	def __reversed__(self):
+		"""
+		Return a new srange_iterator that goes through the values from last to first.
+		Like the forward iterator, it chains native range() objects and does not change previous_item.
+		"""
+		return srange_iterator(self, reverse=True)
+
 	def __repr__(self):
 		""" Return string representation for srange. """
 		try:	length = self.len()
@@ -153,31 +872,78 @@ class srange:
 		return self.r
 
 	def __getitem__(self, n):
-		""" Return the n-th element in the string range. """
+		"""
+		Return the n-th element in the string range, negative n counts back from the end.
+		As with index(), None is returned when n is past either end of the range.
+		If n is a slice, a new srange is returned holding the values at those positions, see __slice().
+
+		EXAMPLE::
+			>>> sr = srange("3,5,9-20")
+			>>> print (sr[-1], sr[1:5], sr[::2])
+			20 5,9-11 3,9-19:2
+		"""
+		if isinstance(n, slice):
+			return self.__slice(n)
+		if isinstance(n, self.intTypes) and n < 0:
+			n += self.len()
+			if n < 0:
+				return None
 		return self.index(n)
 
+	def __slice(self, sl):
+		"""
+		Return a new srange with the values at the positions selected by the slice sl.
+		An srange is always increasing, so a negative step selects the same values as the equivalent positive step.
+		The first position is found by a binary search of the cached counts, and only the simple ranges
+		that hold selected values are visited, there is no string in between.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+		"""
+
+		counts = self.__index_tables()[1]
+		pos = range(counts[-1])[sl]				# the selected positions, range() handles all of the slice rules
+		if pos.step < 0:
+			pos = pos[::-1]
+		if not pos:
+			return self._from_tuple_list([], auto_reset=self.auto_reset)
+		(first, last, step) = (pos.start, pos[-1], pos.step)
+
+		lout = []
+		i = bisect_right(counts, first) - 1		# simple range holding the first position
+		while i < len(self.__lo) and counts[i] <= last:
+			(c0, c1) = (counts[i], counts[i+1]-1)	# positions held by simple range i
+			p = first if first >= c0 else first - ((first-c0)//step)*step	# first selected position in it
+			q = min(last, c1)
+			if p <= q:
+				(lo, stride) = (self.__lo[i], self.__stride[i])
+				q = p + ((q-p)//step)*step
+				lout.append((lo + (p-c0)*stride, lo + (q-c0)*stride, stride*step if q > p else 1))
+			i += 1
+		return self._from_tuple_list(lout, auto_reset=self.auto_reset)
+
 	def __next__(self):							# this is required for python3 iterator
 		""" Return the n-th element in the string range. """
 		return self.next()
 
-	def next(self):								# this is required for python2 iterator
+	def next(self):
 		""" Return the next value in the string range. Also update self.previous_item. """
 
-		if not self.l:
+		if not self.__lo:
+			raise StopIteration
+		(item, i) = self.__cursor				# the simple range that produced previous_item
+		if item != self.previous_item:			# previous_item was set from outside, so search for it
+			i = None
+		(value, i) = self.__following(self.previous_item, i)
+		if value is None:
+#			self.reset_previous()				# removed July 21-2014 JZT, do NOT reset at end of range
 			raise StopIteration
-		for (lo, hi, stride) in self.l:
-			if self.previous_item < lo:			# start of this simple range is big enough
-				self.previous_item = lo
-				return lo
-			elif self.previous_item >= lo and self.previous_item < hi:	# within this simple range
-				self.previous_item += stride - ((self.previous_item-lo) % stride)
-				return self.previous_item
-#		self.reset_previous()					# removed July 21-2014 JZT, do NOT reset at end of range
-		raise StopIteration
+		self.previous_item = value
+		self.__cursor = (value, i)
+		return value
 
 	def after(self, val):
 		"""
 		Return the value or the element that follows after the given value.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
 
 		EXAMPLE::
 			>>> sr = srange("3,5,9-20")
@@ -185,19 +951,92 @@ class srange:
 			9
 		"""
 
-		if not self.l:
+		if not self.__lo:
 			return None
-		previous_save = self.previous_item		# save self.previous_item for later resetting
 		try:
-			self.previous_item = int(val)		# temporarily set self.previous_item to val
+			val = int(val)
 		except:
 			raise ValueError("argument to srange.after() must be a number")
+		return self.__following(val)[0]
+
+	def prev(self):
+		"""
+		Return the value in the string range before previous_item, and set previous_item to it.
+		This is next() going backwards, use reset_previous(end=True) to start from the end of the range.
+		StopIteration is raised when there is no earlier value.
+		"""
+
+		if not self.__lo:
+			raise StopIteration
+		(item, i) = self.__cursor				# the simple range that produced previous_item
+		if item != self.previous_item:			# previous_item was set from outside, so search for it
+			i = None
+		(value, i) = self.__preceding(self.previous_item, i)
+		if value is None:
+			raise StopIteration
+		self.previous_item = value
+		self.__cursor = (value, i)
+		return value
+
+	def before(self, val):
+		"""
+		Return the value of the element that comes before the given value, or None if there is none.
+		This is the counterpart of after(), the value is found by a binary search.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> sr = srange("3,5,9-20")
+			>>> print (sr.before(9))
+			5
+		"""
+
+		if not self.__lo:
+			return None
 		try:
-			after = self.next()
+			val = int(val)
 		except:
-			after = None
-		self.previous_item = previous_save		# reset self.previous_item to original value
-		return after
+			raise ValueError("argument to srange.before() must be a number")
+		return self.__preceding(val)[0]
+
+	def __preceding(self, val, i=None):
+		"""
+		Return the tuple (value, i), where value is the last value in the range that is less than val,
+		and i is the index of the simple range that holds value (value is None if there is no such value).
+		If i is given, the search starts at simple range i (going down), which must not be before the simple
+		range holding val, this makes stepping backwards O(1). Otherwise the start is found by a binary search.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+		"""
+
+		if i is None:
+			i = bisect_left(self.__lo, val) - 1	# last simple range with lo < val
+		else:
+			i = min(i, len(self.__lo)-1)
+			while i >= 0 and self.__lo[i] >= val:
+				i -= 1
+		if i < 0:
+			return (None, i)
+		(lo, hi, stride) = (self.__lo[i], self.__hi[i], self.__stride[i])
+		return (lo + ((min(val-1, hi)-lo)//stride)*stride, i)
+
+	def __following(self, val, i=None):
+		"""
+		Return the tuple (value, i), where value is the first value in the range that is greater than val,
+		and i is the index of the simple range that holds value (value is None if there is no such value).
+		If i is given, the search starts at simple range i, which must not be past the simple range holding val,
+		this makes stepping through the range O(1). Otherwise the start is found by a binary search.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+		"""
+
+		if i is None:
+			i = max(bisect_right(self.__lo, val) - 1, 0)
+		while i < len(self.__lo):
+			(lo, hi, stride) = (self.__lo[i], self.__hi[i], self.__stride[i])
+			if val < lo:						# start of this simple range is big enough
+				return (lo, i)
+			elif val < hi:						# within this simple range
+				return (val + stride - ((val-lo) % stride), i)
+			i += 1
+		return (None, i)
 
 	def first(self):
 		"""
@@ -210,9 +1049,9 @@ class srange:
 			3
 		"""
 
-		if not self.l:
+		if not self.__lo:
 			raise ValueError("String range is empty.")
-		return (self.l[0])[0]
+		return self.__lo[0]
 
 	def last(self):
 		"""
@@ -225,14 +1064,15 @@ class srange:
 			20
 		"""
 
-		if not self.l:
+		if not self.__lo:
 			raise ValueError("String range is empty.")
-		return (self.l[-1])[1]
+		return self.__hi[-1]
 
 	def len(self):
 		"""
 		Return the number of items in the string range.
 		This method uses but does not change any internal variables, e.g. no self.xxxx
+		The total is cached, and kept up to date by add() & discard(), so this is O(1).
 
 		EXAMPLE::
 			>>> sr = srange("3,5,9-20")
@@ -240,14 +1080,21 @@ class srange:
 			14
 		"""
 
-		if not self.l: 
+		if not self.__lo:
 			return 0
+		if self.__length is None:
+			self.__length = self.__index_tables()[1][-1]
+		return self.__length
 
-		total = 0
-		for (lo, hi, stride) in self.l:
-#			total += (hi-lo)/stride + 1			# accumulate length of each simple range
-			total += int((hi-lo)/stride) + 1	# accumulate length of each simple range, python3 (/ --> float)
-		return total
+	def segment_count(self):
+		"""
+		Return the number of simple ranges used to hold the values, the cost of next(), index(), etc. grows with it.
+
+		EXAMPLE::
+			>>> print (srange("1,2,4,5,7,8").segment_count(), srange("1,2,4,5,7,8", compaction='optimal').segment_count())
+			6 3
+		"""
+		return len(self.__lo)
 
 	def __len__(self):
 		""" This is redundant with len(), you can use s.len(), or len(s).
@@ -259,44 +1106,238 @@ class srange:
 		"""
 		Return True if item is in string range self.r, False otherwise.
 		This method uses but does not change any internal variables, e.g. no self.xxxx
+		The simple range that might hold item is found by a binary search, O(log k) for k simple ranges.
 		"""
 
-		if not self.l:
+		if not self.__lo:
 			return False
 		if not isinstance(item, self.intTypes):
 			raise TypeError("Element must be integer number")
 
-		for (lo, hi, stride) in self.l:
-			if lo <= item and item <= hi:
-				return (float(item-lo)/stride).is_integer()
-		return False
+		i = bisect_right(self.__lo, item) - 1	# the only simple range that can contain item
+		if i < 0:
+			return False
+		return item <= self.__hi[i] and (item-self.__lo[i]) % self.__stride[i] == 0
+
+	def contains_many(self, values):
+		"""
+		Return a numpy boolean array, True where the corresponding element of values is in the range.
+		This is the vectorized form of is_in_range(), values is an array (or list) of integers, numpy must be available.
+		The simple ranges are found with numpy.searchsorted() on the lo values, and the stride is checked with
+		unsigned integer arithmetic, so the test is exact over the whole int64 range.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-20:2").contains_many([3, 4, 11, 12]))
+			[ True False  True False]
+		"""
+
+		np = _numpy()
+		v = self.__int64_array(np, values, 'Values')
+		if not self.__lo:
+			return np.zeros(v.shape, dtype=bool)
+		return self.__locate_many(np, v)[0]
+
+	def __int64_array(self, np, values, name):
+		"""
+		Return values as a numpy int64 array, raise TypeError if values are not integers,
+		and ValueError if unsigned values are too big for int64 (the cast would wrap them around to negative values).
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+		v = np.asarray(values)
+		if v.size and v.dtype.kind not in 'iu':
+			raise TypeError(name+" must be integers, not "+str(v.dtype))
+		if v.size and v.dtype.kind == 'u' and v.max() > np.iinfo(np.int64).max:
+			raise ValueError(name+" do not fit in int64, the largest is "+str(v.max()))
+		return v.astype(np.int64, copy=False)
+
+	def __locate_many(self, np, v):
+		"""
+		Return the tuple (found, i, steps) for the int64 array of values v, the range must not be empty.
+		found is True where a value is in the range, i is the index of the simple range that can contain each value,
+		and steps is the number of strides from lo of that simple range to the value (only meaningful where found).
+		The simple ranges are found with numpy.searchsorted() on the lo values, and the stride is checked with
+		unsigned integer arithmetic, so the result is exact over the whole int64 range.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+		"""
+		(lo, hi, stride) = self.__numpy_columns(np)
+		i = np.searchsorted(lo, v, side='right') - 1	# the only simple range that can contain each value
+		found = i >= 0
+		i[~found] = 0
+		offset = v.view(np.uint64) - lo[i].view(np.uint64)	# exact (v-lo) wherever v>=lo, even for huge ranges
+		(steps, rem) = np.divmod(offset, stride[i].view(np.uint64))
+		found &= (v <= hi[i]) & (rem == 0)
+		return (found, i, steps.view(np.int64))
+
+	def index_many(self, positions):
+		"""
+		Return a numpy int64 array of the values at each of the positions (an array or list of integers).
+		This is the vectorized form of index(), numpy must be available.
+		The simple ranges are found with numpy.searchsorted() on the cached counts, with uint64 arithmetic,
+		so this is exact even when the range has more than 2**63 values.
+		An IndexError is raised if any position is negative or not less than len().
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-20").index_many([0, 1, 2, 13]))
+			[ 3  5  9 20]
+		"""
+
+		np = _numpy()
+		if not self.__lo:
+			raise ValueError('String range is empty.')
+		p = self.__int64_array(np, positions, 'Positions')
+		(lo, hi, stride) = self.__numpy_columns(np)
+		counts = self.__numpy_counts(np)
+		if p.size and (p.min() < 0 or p.view(np.uint64).max() >= counts[-1]):
+			raise IndexError('Positions must be in the range [0, %d)' % counts[-1])
+		u = np.uint64
+		p = p.view(u)
+		i = np.searchsorted(counts, p, side='right') - 1	# simple range containing each position
+		return (lo[i].view(u) + (p-counts[i])*stride[i].view(u)).view(np.int64)
+
+	def val2index_many(self, values, missing=-1):
+		"""
+		Return a numpy int64 array of the index into the srange of each of the values (an array or list of integers).
+		This is the vectorized form of val2index(), numpy must be available.
+		Values that are not in the range are given the index missing (default -1), instead of None as in val2index().
+		Use contains_many(values) to get a mask of the values that are in the range.
+		An OverflowError is raised if the index of a value does not fit in int64 (only for ranges of more than 2**63 values).
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-20").val2index_many([5, 6, 20]))
+			[ 1 -1 13]
+		"""
+
+		np = _numpy()
+		if not self.__lo:
+			raise ValueError("String range is empty.")
+		v = self.__int64_array(np, values, 'Values')
+		(found, i, steps) = self.__locate_many(np, v)
+		counts = self.__numpy_counts(np)
+		index = counts[i] + steps.view(np.uint64)
+		if counts[-1] > np.iinfo(np.int64).max and (index[found] > np.iinfo(np.int64).max).any():
+			raise OverflowError("An index into the range does not fit in int64.")
+		return np.where(found, index.view(np.int64), missing)
+
+	def floor_many(self, values, missing=None):
+		"""
+		Return a numpy int64 array with the largest value in the range that is <= each of the values, numpy must be available.
+		Values below the start of the range are given missing, which defaults to the most negative int64
+		(this can not be in a range, as -inf is stored as -MAXINT).
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-20:2").floor_many([4, 10, 30]))
+			[ 3  9 19]
+		"""
+
+		np = _numpy()
+		v = self.__int64_array(np, values, 'Values')
+		if missing is None:
+			missing = np.iinfo(np.int64).min
+		if not self.__lo:
+			return np.full(v.shape, missing, dtype=np.int64)
+		(floor, found) = self.__floor_many(np, v)
+		return np.where(found, floor, missing)
+
+	def ceil_many(self, values, missing=None):
+		"""
+		Return a numpy int64 array with the smallest value in the range that is >= each of the values, numpy must be available.
+		Values above the end of the range are given missing, which defaults to the most negative int64.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-20:2").ceil_many([2, 4, 10]))
+			[ 3  5 11]
+		"""
+
+		np = _numpy()
+		v = self.__int64_array(np, values, 'Values')
+		if missing is None:
+			missing = np.iinfo(np.int64).min
+		if not self.__lo:
+			return np.full(v.shape, missing, dtype=np.int64)
+		(ceil, found) = self.__ceil_many(np, v)
+		return np.where(found, ceil, missing)
+
+	def nearest_many(self, values):
+		"""
+		Return a numpy int64 array with the value in the range that is nearest to each of the values,
+		when two values are equally near, the lower one is used. numpy must be available.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-20:2").nearest_many([2, 4, 7, 30]))
+			[ 3  3  5 19]
+		"""
+
+		np = _numpy()
+		if not self.__lo:
+			raise ValueError("String range is empty.")
+		v = self.__int64_array(np, values, 'Values')
+		(floor, has_floor) = self.__floor_many(np, v)
+		(ceil, has_ceil) = self.__ceil_many(np, v)
+		u = np.uint64
+		use_ceil = ~has_floor | (has_ceil & ((ceil.view(u) - v.view(u)) < (v.view(u) - floor.view(u))))
+		return np.where(use_ceil, ceil, floor)
+
+	def __floor_many(self, np, v):
+		"""
+		Return (floor, found), the largest value in the range <= each value in v, and where there is one.
+		The arithmetic is done with uint64, so it is exact over the whole int64 range, the range must not be empty.
+		"""
+		u = np.uint64
+		(lo, hi, stride) = self.__numpy_columns(np)
+		i = np.searchsorted(lo, v, side='right') - 1	# last simple range with lo <= value
+		found = i >= 0
+		i[~found] = 0
+		(lo, hi, stride) = (lo[i].view(u), hi[i], stride[i].view(u))
+		steps = (np.minimum(v, hi).view(u) - lo) // stride
+		return ((lo + steps*stride).view(np.int64), found)
+
+	def __ceil_many(self, np, v):
+		"""
+		Return (ceil, found), the smallest value in the range >= each value in v, and where there is one.
+		The arithmetic is done with uint64, so it is exact over the whole int64 range, the range must not be empty.
+		"""
+		u = np.uint64
+		(lo, hi, stride) = self.__numpy_columns(np)
+		i = np.searchsorted(hi, v, side='left')	# first simple range with hi >= value
+		found = i < len(hi)
+		i[~found] = 0
+		(lo, stride) = (lo[i], stride[i].view(u))
+		(steps, rem) = np.divmod(np.maximum(v, lo).view(u) - lo.view(u), stride)
+		steps += (rem > 0)
+		return ((lo.view(u) + steps*stride).view(np.int64), found)
 
 	def index(self, n):
 		"""
 		Return the n-th element from the string range.
 		This method uses but does not change any internal variables, e.g. no self.xxxx
+		The simple range holding the n-th element is found by a binary search of the cached counts.
 		"""
 
-		if not self.l:
+		if not self.__lo:
 			raise ValueError('String range is empty.')
 		elif not isinstance(n, self.intTypes):
 			raise TypeError('Element must be an integer number, not a '+str(type(n)))
 		elif (n < 0):
 			raise ValueError('Index must be non-negative, not '+str(n))
 
-		count = 0
-		for (lo, hi, stride) in self.l:
-#			hi_count = count + (hi-lo)/stride	# count at hi
-			hi_count = count + int((hi-lo)/stride)	# count at hi, in python3 i/j --> float
-			if n <= hi_count:
-				return lo + (n-count)*stride
-			count = hi_count + 1
-		return None
+		counts = self.__index_tables()[1]
+		if n >= counts[-1]:
+			return None
+		i = bisect_right(counts, n) - 1			# simple range containing the n-th value
+		return self.__lo[i] + (n-counts[i])*self.__stride[i]
 
 	def val2index(self, val):
 		"""
 		Return the index into the srange that corresponds to val.
+		Returns None if val is not in the range.
 		This method uses but does not change any internal variables, e.g. no self.xxxx
+		The simple range that might hold val is found by a binary search of the cached lo values.
 
 		EXAMPLE::
 			>>> r = '3, 5, 9-20'
@@ -304,21 +1345,19 @@ class srange:
 			1
 		"""
 
-		if not self.l:
+		if not self.__lo:
 			raise ValueError("String range is empty.")
 		elif not isinstance(val, self.intTypes):
-			raise TypeError('Value must be an integer, not a '+str(type(n)))
-
-		index = 0
-		for (lo, hi, stride) in self.l:
-			if lo <= val and val <= hi:			# val is in this simple range
-				index += float(val-lo)/stride
-				if index.is_integer():
-					return int(index)
-				else:
-					return None
-			index += int(hi-lo+1) / int(stride)	# increment index for next simple range
-		return None
+			raise TypeError('Value must be an integer, not a '+str(type(val)))
+
+		(los, counts) = self.__index_tables()
+		i = bisect_right(los, val) - 1			# the only simple range that can contain val
+		if i < 0:
+			return None
+		(lo, hi, stride) = (los[i], self.__hi[i], self.__stride[i])
+		if val > hi or (val-lo) % stride:
+			return None
+		return counts[i] + (val-lo)//stride
 
 
 	def sub_range(self, start, n, set_last=False):
@@ -330,14 +1369,29 @@ class srange:
 		after start. If set_last is True, then self.previous_item is set to the new 
 		end, otherwise no change is made.
 		This method only changes an internal variable "self.previous_item" when set_last is True.
+		Use sub_srange() to get the sub range as an srange, without making and parsing a string.
 
 		EXAMPLE::
 			>>> sr = srange('3,5,9-20')
 			>>> print (sr.sub_range(start = 5, n = 3))
 			5,9-10
 		"""
+		return str(self.sub_srange(start, n, set_last=set_last))
 
-		if not self.l:
+	def sub_srange(self, start, n, set_last=False):
+		"""
+		Return a sub range from the original range as a new srange, this is the same as sub_range(),
+		but without the string. The position of start is found by a binary search, and only the
+		simple ranges holding the new values are copied, so this is O(log k) plus the size of the result.
+		This method only changes an internal variable "self.previous_item" when set_last is True.
+
+		EXAMPLE::
+			>>> sr = srange('3,5,9-20')
+			>>> print (repr(sr.sub_srange(start = 5, n = 3)))
+			srange('5,9-10', len=3, previous=4, auto_reset=True)
+		"""
+
+		if not self.__lo:
 			raise ValueError("String range is empty.")
 		elif not isinstance(start, self.intTypes):
 			raise TypeError("Start value (start) must be an integer.")
@@ -346,29 +1400,98 @@ class srange:
 		elif n < 0:
 			raise ValueError("Number of elements must be greater zero.")
 
-		hi = self.last()						# in case hi not set in loop
-		lout = []
-		for (lo, hi, stride) in self.l:
-			if hi < start:						# try next simple range
-				continue
-			start = max(start,lo)
-			lo = start + ((start-lo) % stride)	# either start or first number after start
-			hi = min(lo + (n-1)*stride, hi)
-			if lo>hi:							# nothing in this simple range
-				continue
-#			n -= (hi-lo)/stride + 1
-			n -= int((hi-lo)/stride) + 1		# in python3 i/j --> float
-			lout.append((lo,hi,stride))
-			if n < 1:
-				break
+		(los, counts) = self.__index_tables()
+		i = bisect_right(los, start) - 1		# the simple range that might hold start
+		if i < 0:
+			p = 0
+		elif start <= self.__hi[i]:				# position of start, or of the first number after start
+			p = counts[i] - ((los[i]-start)//self.__stride[i])
+		else:
+			p = counts[i+1]
+		sub = self.__slice(slice(p, p+n))
 
 		if set_last:							# set previous_item was requested
-			self.previous_item = hi
+			self.previous_item = sub.last() if sub.len() else self.last()
+		return sub
 
-		lout = self.__compact(lout)				# compactify the list
-		return self.__tuple_list_to_str(lout)	# return the string
+	def split(self, n_parts):
+		"""
+		Return a list of n_parts new sranges, that together hold all of the values, in order.
+		The pieces have nearly equal numbers of values (they differ by at most 1), some are empty if n_parts > len().
+		The boundaries are found from the cached counts, the values are never expanded.
+		This is meant for spreading work over several processes, each piece is a small object.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print ([str(piece) for piece in srange("1-10,20-23").split(3)])
+			['1-4', '5-9', '10,20-23']
+		"""
 
+		if not isinstance(n_parts, self.intTypes):
+			raise TypeError("Number of parts must be an integer, not a "+str(type(n_parts)))
+		elif n_parts < 1:
+			raise ValueError("Number of parts must be positive, not "+str(n_parts))
+		total = self.len()
+		bounds = [(j*total)//n_parts for j in range(n_parts+1)]
+		return [self.__slice(slice(a, b)) for (a, b) in zip(bounds[:-1], bounds[1:])]
+
+	def split_by(self, chunk_len):
+		"""
+		Return a list of new sranges each holding chunk_len values (the last one may have fewer),
+		that together hold all of the values, in order. As with split(), nothing is expanded.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
 
+		EXAMPLE::
+			>>> print ([str(piece) for piece in srange("1-10,20-23").split_by(6)])
+			['1-6', '7-10,20-21', '22-23']
+		"""
+
+		if not isinstance(chunk_len, self.intTypes):
+			raise TypeError("Chunk length must be an integer, not a "+str(type(chunk_len)))
+		elif chunk_len < 1:
+			raise ValueError("Chunk length must be positive, not "+str(chunk_len))
+		return list(self.__pieces(chunk_len))
+
+	def __pieces(self, chunk_len):
+		""" Generator of the pieces of split_by(chunk_len), each one is made as it is needed. """
+		for a in range(0, self.len(), chunk_len):
+			yield self.__slice(slice(a, a+chunk_len))
+
+	def parallel_map(self, func, executor=None, chunk=None, ordered=True, max_pending=None, max_workers=None):
+		"""
+		Generator that yields func(value) for each value in the range, computed on a pool of threads or processes.
+
+		The range is cut into pieces of chunk values (see split_by()), and each piece is sent to the pool
+		as an srange, so the values are only expanded by the workers.
+		executor is a concurrent.futures.Executor, or None or 'thread' for an internal thread pool,
+		or 'process' for an internal process pool (func must then be picklable), with max_workers workers.
+		If ordered is True (default) the results are in the order of the values, otherwise the results
+		of each piece come as soon as it is done. At most max_pending pieces are waiting in the pool,
+		and stopping the loop (closing the generator) cancels the pieces that have not started.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (list(srange("1-5").parallel_map(lambda x: x*x)))
+			[1, 4, 9, 16, 25]
+		"""
+
+		from . import parallel					# imported on first use, it needs concurrent.futures
+		if chunk is None:
+			chunk = parallel.default_chunk(self.len())
+		elif not isinstance(chunk, self.intTypes) or chunk < 1:
+			raise ValueError("chunk must be a positive integer, not %r" % (chunk,))
+		tasks = ((parallel.call_each, func, piece) for piece in self.__pieces(chunk))
+		return parallel.chunk_map(tasks, executor=executor, ordered=ordered, max_pending=max_pending, max_workers=max_workers)
+
+	def parallel_for(self, func, executor=None, chunk=None, max_pending=None, max_workers=None):
+		"""
+		Call func(value) for each value in the range on a pool of threads or processes, the results are discarded.
+		This is parallel_map() without the results, it returns when all of the calls are done,
+		an exception from func is raised here, and the calls that have not started are cancelled.
+		"""
+		for result in self.parallel_map(func, executor=executor, chunk=chunk, ordered=False,
+				max_pending=max_pending, max_workers=max_workers):
+			pass
 
 	def list(self):
 		"""
@@ -392,23 +1515,569 @@ class srange:
 
 		if self.len() > 10000000:				# 1e7, a big number
 			raise IndexError("Resulting list too large, > 1e7.")
-		elif not self.l:
+		elif not self.__lo:
 			return []
 
 		lout = []
-		for (lo, hi, stride) in self.l:
+		for (lo, hi, stride) in self._segments():
 			lout.extend(range(lo,hi+1,stride))
 		return lout
 
+	def to_array(self, dtype=None, out=None):
+		"""
+		Expand a string range into a numpy array, numpy must be available.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		dtype is the type of the new array, the default is numpy.int64.
+		If out is given, it must be a 1-d numpy array with length self.len(), it is filled and returned (dtype is ignored).
+		Each simple range is written into its slice of the array by numpy.arange(), so unlike list(),
+		there is no limit of 1e7 on the length.
+
+		EXAMPLE::
+			>>> print (srange("3,5,9-13").to_array())
+			[ 3  5  9 10 11 12 13]
+		"""
+
+		np = _numpy()
+		n = self.len()
+		if out is None:
+			out = np.empty(n, dtype=(np.int64 if dtype is None else dtype))
+		elif out.shape != (n,):
+			raise ValueError("out must be a 1-d array of length %d, not shape %r" % (n, out.shape))
+
+		i = 0
+		for (lo, hi, stride) in self._segments():
+			m = (hi-lo)//stride + 1				# number of values in this simple range
+			out[i:i+m] = np.arange(lo, hi+1, stride, dtype=out.dtype)
+			i += m
+		return out
+
+
+	def iter_chunks(self, size, as_array=True):
+		"""
+		Generator that returns consecutive blocks of at most size values from the range.
+		If as_array is True (default) each block is a numpy int64 array (this needs numpy),
+		otherwise each block is a list of python range objects, which together hold the block's values.
+		Only the simple ranges touched by a block are visited, the whole range is never expanded.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> for chunk in srange("1-5,9-10").iter_chunks(3, as_array=False): print (chunk)
+			[range(1, 4)]
+			[range(4, 6), range(9, 10)]
+			[range(10, 11)]
+		"""
+
+		if not isinstance(size, self.intTypes):
+			raise TypeError("Chunk size must be an integer, not a "+str(type(size)))
+		elif size < 1:
+			raise ValueError("Chunk size must be positive, not "+str(size))
+		if as_array:
+			np = _numpy()
+
+		chunk = []
+		room = size								# number of values still needed to fill chunk
+		for (lo, hi, stride) in self._segments():
+			r = range(lo, hi+1, stride)
+			while r:
+				piece = r[:room]				# slicing a range is O(1), nothing is expanded
+				chunk.append(piece)
+				room -= len(piece)
+				r = r[len(piece):]
+				if room == 0:
+					yield self.__ranges_to_array(chunk, np) if as_array else chunk
+					chunk = []
+					room = size
+		if chunk:
+			yield self.__ranges_to_array(chunk, np) if as_array else chunk
+
+	def __ranges_to_array(self, ranges, np):
+		"""
+		Return a numpy int64 array holding the values of a list of python range objects, in order.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+		out = np.empty(sum(len(r) for r in ranges), dtype=np.int64)
+		i = 0
+		for r in ranges:
+			out[i:i+len(r)] = np.arange(r.start, r.stop, r.step, dtype=np.int64)
+			i += len(r)
+		return out
+
+	def union(self, other):
+		"""
+		Return a new srange with all of the values that are in self or in other (or both).
+		other may be an srange or anything that can make one, e.g. a string or a list of integers.
+		This is done directly on the simple ranges, without expanding the values, see __combine().
+
+		EXAMPLE::
+			>>> print (srange("1-10").union("5-20:5"))
+			1-10,15-20:5
+		"""
+		return self.__set_operation(other, '|')
+
+	def intersection(self, other):
+		"""
+		Return a new srange with all of the values that are in both self and other.
+		other may be an srange or anything that can make one, e.g. a string or a list of integers.
+		Overlapping strided simple ranges are intersected arithmetically.
+
+		EXAMPLE::
+			>>> print (srange("0-30:2").intersection("0-30:3"))
+			0-30:6
+		"""
+		return self.__set_operation(other, '&')
+
+	def difference(self, other):
+		"""
+		Return a new srange with all of the values that are in self, but not in other.
+		other may be an srange or anything that can make one, e.g. a string or a list of integers.
+
+		EXAMPLE::
+			>>> print (srange("1-20").difference("5-8,11"))
+			1-4,9-10,12-20
+		"""
+		return self.__set_operation(other, '-')
+
+	def symmetric_difference(self, other):
+		"""
+		Return a new srange with all of the values that are in exactly one of self and other.
+		other may be an srange or anything that can make one, e.g. a string or a list of integers.
+
+		EXAMPLE::
+			>>> print (srange("1-10").symmetric_difference("6-15"))
+			1-5,11-15
+		"""
+		return self.__set_operation(other, '^')
+
+	def __or__(self, other):
+		""" Return self.union(other), other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.__set_operation(other, '|')
+
+	def __and__(self, other):
+		""" Return self.intersection(other), other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.__set_operation(other, '&')
+
+	def __sub__(self, other):
+		""" Return self.difference(other), other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.__set_operation(other, '-')
+
+	def __xor__(self, other):
+		""" Return self.symmetric_difference(other), other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.__set_operation(other, '^')
+
+	def __eq__(self, other):
+		"""
+		Return True if self and other have the same values, other must be an srange.
+		Different simple ranges can hold the same values (e.g. "1,3,5" and "1-5:2"), so when the columns
+		are not identical, the canonical simple ranges of both are compared, see __canonical(). This is O(k).
+		"""
+		if not isinstance(other, srange):
+			return NotImplemented
+		if self is other or (self.__lo == other.__lo and self.__hi == other.__hi and self.__stride == other.__stride):
+			return True
+		if self.len() != other.len():
+			return False
+		return all(a == b for (a, b) in zip(self.__canonical(), other.__canonical()))
+
+	def __hash__(self):
+		"""
+		Return a hash of the values, equal sranges have equal hashes. The hash is cached until the range is changed,
+		but an srange that is changed (e.g. by add()) while it is a key in a dict or in a set will not be found again.
+		"""
+		if self.__hash is None:
+			self.__hash = hash(tuple(self.__canonical()))
+		return self.__hash
+
+	def __le__(self, other):
+		""" Return self.issubset(other), other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.issubset(other)
+
+	def __lt__(self, other):
+		""" Return True if self is a proper subset of other, other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.len() < other.len() and self.issubset(other)
+
+	def __ge__(self, other):
+		""" Return self.issuperset(other), other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return other.issubset(self)
+
+	def __gt__(self, other):
+		""" Return True if self is a proper superset of other, other must be an srange. """
+		if not isinstance(other, srange):
+			return NotImplemented
+		return self.len() > other.len() and other.issubset(self)
+
+	def issubset(self, other):
+		"""
+		Return True if every value of self is also in other.
+		other may be an srange or anything that can make one, e.g. a string or a list of integers.
+		The intersection is found on the simple ranges (see __combine()), and self is a subset when
+		the intersection has as many values as self. No values are expanded, and only the simple ranges
+		where the spans of both overlap are read (see __overlap()).
+
+		EXAMPLE::
+			>>> print (srange("4-8:2").issubset("1-10"), srange("1-10") <= srange("1-10:2"))
+			True False
+		"""
+		if not isinstance(other, srange):
+			other = srange(other)
+		common = self.__combine(*self.__overlap(other), '&')
+		return sum((hi-lo)//stride + 1 for (lo, hi, stride) in common) == self.len()
+
+	def issuperset(self, other):
+		""" Return True if every value of other is also in self, see issubset(). """
+		if not isinstance(other, srange):
+			other = srange(other)
+		return other.issubset(self)
+
+	def isdisjoint(self, other):
+		"""
+		Return True if self and other have no values in common, only the simple ranges where the spans
+		of both overlap are read, see issubset().
+
+		EXAMPLE::
+			>>> print (srange("0-20:2").isdisjoint("1-21:2"))
+			True
+		"""
+		if not isinstance(other, srange):
+			other = srange(other)
+		return not self.__combine(*self.__overlap(other), '&')
+
+	def __canonical(self):
+		"""
+		Generator of the canonical simple ranges, which depend only on the values and not on how they were compacted.
+		Starting at the first value, each simple range takes the next value, which fixes its stride, and then every
+		value that continues with the same stride. The stored simple ranges are used to jump to the end of a run, so
+		this is O(k) and no values are expanded.
+		This method uses but does not change any internal variables.
 
-	def reset_previous(self):
-		""" Reset previous_item to the lowest possible integer value. """
+		EXAMPLE::
+			>>> print (list(srange("1,3,5,7-9").__canonical()))
+			[(1, 7, 2), (8, 9, 1)]
+		"""
+		(los, his, strides) = (self.__lo, self.__hi, self.__stride)
+		k = len(los)
+		if not k:
+			return
+		(i, v) = (0, los[0])					# simple range i and value v, the start of a canonical simple range
+		while True:
+			if v < his[i]:						# the value after v
+				(j, w) = (i, v + strides[i])
+			elif i+1 < k:
+				(j, w) = (i+1, los[i+1])
+			else:
+				yield (v, v, 1)					# the last value is by itself
+				return
+			(start, d) = (v, w - v)
+			(i, v) = (j, w)						# v is the last value of the canonical simple range so far
+			while True:
+				if v < his[i]:
+					if strides[i] != d:
+						break
+					v = his[i]					# the rest of simple range i continues the run
+				elif i+1 < k and los[i+1] == v + d:
+					(i, v) = (i+1, los[i+1])
+				else:
+					break
+			yield (start, v, d)
+			if v < his[i]:						# the next canonical simple range starts after v
+				v += strides[i]
+			elif i+1 < k:
+				(i, v) = (i+1, los[i+1])
+			else:
+				return
+
+	def add(self, value):
+		"""
+		Add the integer value to the range, in place. Nothing changes if value is already in the range.
+
+		EXAMPLE::
+			>>> sr = srange("1-4,6-9")
+			>>> sr.add(5)
+			>>> print (sr)
+			1-9
+		"""
+		self.add_range(value, value)
+
+	def discard(self, value):
+		"""
+		Remove the integer value from the range, in place. It is not an error if value is not in the range.
+
+		EXAMPLE::
+			>>> sr = srange("1-9")
+			>>> sr.discard(5)
+			>>> print (sr)
+			1-4,6-9
+		"""
+		self.discard_range(value, value)
+
+	def add_range(self, lo, hi, stride=1):
+		"""
+		Add the values lo, lo+stride, ... up to hi to the range, in place, see __update().
+
+		EXAMPLE::
+			>>> sr = srange("1-10")
+			>>> sr.add_range(12, 20, 2)
+			>>> print (sr)
+			1-10,12-20:2
+		"""
+		self.__update(self.__simple_range(lo, hi, stride), '|')
+
+	def discard_range(self, lo, hi, stride=1):
+		"""
+		Remove the values lo, lo+stride, ... up to hi from the range, in place, see __update().
+		Values that are not in the range are ignored.
+
+		EXAMPLE::
+			>>> sr = srange("1-20")
+			>>> sr.discard_range(2, 20, 2)
+			>>> print (sr)
+			1-19:2
+		"""
+		self.__update(self.__simple_range(lo, hi, stride), '-')
+
+	def __simple_range(self, lo, hi, stride):
+		""" Check lo, hi & stride, and return them as a simple range (lo,hi,stride) with hi on the stride. """
+		if not all(isinstance(v, self.intTypes) for v in (lo, hi, stride)):
+			raise TypeError("lo, hi and stride must be integers, not %r" % ((lo, hi, stride),))
+		elif stride < 1 or hi < lo:
+			raise ValueError("stride is not a positive integer, or hi<lo in simple range %r" % ((lo, hi, stride),))
+		hi -= (hi-lo) % stride					# ensure that hi matches with stride, remove excess
+		return (lo, hi, stride) if lo != hi else (lo, hi, 1)
+
+	def __update(self, t, op):
+		"""
+		Change this range in place to self | t or self - t (op is '|' or '-'), t is one simple range.
+		The simple ranges that overlap t are found by binary searches of the hi & lo columns, they are combined
+		with t together with two neighbours on each side (which may join the result, e.g. in a run of single values)
+		and only these are compacted.
+		The columns are replaced, not changed, so iterators that are already running are not disturbed.
+		The cached length is changed by the number of values added or removed, and the cached counts are
+		spliced the same way as the columns, with the later counts shifted at C level (see _splice_counts()).
+		The string is made again when it is needed.
+		"""
+		(los, his, strides) = (self.__lo, self.__hi, self.__stride)
+		(i, j) = self.__window(t[0], t[1], 2)
+		window = self.__segment_list(i, j)
+		new = self.__combine(window, [t], op)
+		new = self.__compact(new) if new else []
+		if new == window:
+			return								# nothing changed, e.g. add() of a value already in the range
+
+		(counts, length) = (self.__counts, self.__length)
+		delta = sum((hi-lo)//stride + 1 for (lo, hi, stride) in new) - sum((hi-lo)//stride + 1 for (lo, hi, stride) in window)
+		if counts is not None:
+			length = counts[-1]
+			middle = []							# counts after each of the new simple ranges
+			total = counts[i]
+			for (lo, hi, stride) in new:
+				total += (hi-lo)//stride + 1
+				middle.append(total)
+			counts = _splice_counts(counts, i, j, middle, delta)
+
+		self.__set_columns(_splice(los, i, j, [n[0] for n in new]), _splice(his, i, j, [n[1] for n in new]),
+			_splice(strides, i, j, [n[2] for n in new]))
+		self.__counts = counts
+		self.__length = length + delta if length is not None else None
+
+	def reset_previous(self, end=False):
+		"""
+		Reset previous_item to the lowest possible integer value.
+		If end is True, previous_item is set just after the last value instead, so that prev() starts at the end.
+		"""
+		if end and self.__lo:
+			self.previous_item = int(self.__hi[-1]+1)
+			self.__cursor = (self.previous_item, len(self.__lo)-1)	# prev() continues from the last simple range
+			return
 		try:
-			l0 = self.l[0]
-			self.previous_item = int(l0[0]-1)	# in python2, the srange may need longs
+			self.previous_item = int(self.__lo[0]-1)
 		except:
 			self.previous_item = -self.MAXINT	# just set to most negative 32bit int
+		self.__cursor = (self.previous_item, 0)	# next() continues from the first simple range
+
 
+	def __set_operation(self, other, op):
+		"""
+		Return a new srange from the set operation op ('|', '&', '-' or '^') between self and other.
+		An intersection only looks at the simple ranges where the spans of both overlap (see __overlap()).
+		Otherwise the larger range (self for a difference) only changes within the span of the other one,
+		so only the simple ranges there (and two neighbours on each side, as in __update()) are combined
+		and compacted, and the rest of the columns are copied as they are, without making tuples.
+		"""
+		if not isinstance(other, srange):
+			other = srange(other)
+		if op == '&':
+			return self._from_tuple_list(self.__combine(*self.__overlap(other), op), auto_reset=self.auto_reset)
+
+		(base, part) = (self, other)
+		if op != '-' and len(other.__lo) > len(self.__lo):
+			(base, part) = (other, self)
+		(i, j, l2) = (0, 0, [])
+		if part.__lo:
+			(i, j) = base.__window(part.__lo[0], part.__hi[-1], 2)
+			if op != '-':
+				l2 = part.__segment_list(0, len(part.__lo))
+			elif i < j:							# only the values of part within the window can be removed
+				l2 = part.__segment_list(*part.__window(base.__lo[i], base.__hi[j-1]))
+		new = self.__combine(base.__segment_list(i, j), l2, op)
+		new = self.__compact(new) if new else []
+
+		sr = self._empty(self.auto_reset)
+		sr.__set_columns(_splice(base.__lo, i, j, [n[0] for n in new]), _splice(base.__hi, i, j, [n[1] for n in new]),
+			_splice(base.__stride, i, j, [n[2] for n in new]))
+		sr.reset_previous()
+		return sr
+
+	def __combine(self, l1, l2, op):
+		"""
+		Return the tuple list for the set operation op ('|', '&', '-' or '^') between the tuple lists l1 and l2.
+		The number line is cut into pieces at the ends of every simple range of both lists, so within a piece,
+		each list holds at most one arithmetic progression. The two progressions are then combined arithmetically,
+		so this is O(k1+k2) when the result has about as many simple ranges as the inputs. When it needs more
+		(e.g. "1-100" - "0-100:3" is 34 simple ranges), the time grows with the number of simple ranges in the
+		result, never with the number of values.
+		The returned list is monotonic, but not compacted.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+
+		l1 = l1 or []
+		l2 = l2 or []
+		edges = []								# sorted & unique, pieces are [edges[j], edges[j+1]-1]
+		for e in heapq.merge(*[[e for (lo, hi, stride) in l for e in (lo, hi+1)] for l in (l1, l2)]):
+			if not edges or e != edges[-1]:
+				edges.append(e)
+
+		lout = []
+		i1 = i2 = 0
+		for (lo, hi) in zip(edges[:-1], edges[1:]):
+			hi -= 1
+			while i1 < len(l1) and l1[i1][1] < lo:
+				i1 += 1
+			while i2 < len(l2) and l2[i2][1] < lo:
+				i2 += 1
+			a = self.__clip(l1[i1], lo, hi) if i1 < len(l1) and l1[i1][0] <= lo else None
+			b = self.__clip(l2[i2], lo, hi) if i2 < len(l2) and l2[i2][0] <= lo else None
+			if a and b:
+				lout.extend(self.__combine_progressions(a, b, op, lo, hi))
+			elif a and op in '|-^':
+				lout.append(self.__simple(a))
+			elif b and op in '|^':
+				lout.append(self.__simple(b))
+		return lout
+
+	def __clip(self, t, lo, hi):
+		"""
+		Return the simple range t=(lo,hi,stride) restricted to the values in [lo,hi], or None if there are none.
+		The stride of t is kept even if only one value remains, use __simple() to get the usual form.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+		(tlo, thi, stride) = t
+		if tlo < lo:
+			tlo += -((tlo-lo)//stride)*stride	# first value >= lo
+		thi = min(thi, hi)
+		if thi < tlo:
+			return None
+		return (tlo, tlo + ((thi-tlo)//stride)*stride, stride)
+
+	def __simple(self, t):
+		""" Return the simple range t in its usual form, where a single value has a stride of 1. """
+		return (t[0], t[1], 1) if t[0] == t[1] else t
+
+	def __combine_progressions(self, a, b, op, lo, hi):
+		"""
+		Return a list of simple ranges from the set operation op between the two progressions a and b,
+		which are each simple ranges that fill [lo,hi] with their stride (from __clip()).
+		The values in both form one progression with stride lcm(stride_a, stride_b) (from __intersect()).
+		A difference is the first progression cut at each of those values, a union or symmetric difference
+		is the progression with the smaller stride cut at each value of the other one. So the number of simple
+		ranges made grows with the number of simple ranges in the result, not with the number of values.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+
+		both = self.__intersect(a, b, lo, hi)
+		if op == '&':
+			return [self.__simple(both)] if both else []
+		if op == '-':
+			return self.__remove_points(a, both, lo, hi)
+
+		(x, y) = (a, b) if a[2] <= b[2] else (b, a)	# y has the larger stride, its values cut x
+		(x0, x1, sx) = x
+		(y0, y1, sy) = y
+		if both and both[2] == sy:				# y is inside x
+			return [self.__simple(x)] if op == '|' else self.__remove_points(x, both, lo, hi)
+		if sx == sy and sx % 2 == 0 and (y0-x0) % sx == sx//2:	# x and y interleave, e.g. evens and odds
+			return [(min(x0, y0), max(x1, y1), sx//2)]
+
+		lout = []
+		start = lo								# the values of x from start up to the next value of y
+		for v in range(y0, y1+1, sy):
+			t = self.__clip(x, start, v-1)
+			if t:
+				lout.append(self.__simple(t))
+			if op == '|' or (v-x0) % sx:		# the symmetric difference leaves out the values in both
+				lout.append((v, v, 1))
+			start = v+1
+		t = self.__clip(x, start, hi)
+		if t:
+			lout.append(self.__simple(t))
+		return lout
+
+	def __intersect(self, a, b, lo, hi):
+		"""
+		Return the simple range (with stride lcm(stride_a, stride_b)) of the values in both progressions a and b
+		within [lo,hi], or None if there are none, by solving v = a0 (mod sa) and v = b0 (mod sb).
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+		(a0, a1, sa) = a
+		(b0, b1, sb) = b
+		g = gcd(sa, sb)
+		if (b0-a0) % g:
+			return None
+		period = sa // g * sb
+		k = ((b0-a0)//g) * _inverse(sa//g, sb//g) if sb > g else 0
+		first = a0 + sa*k
+		return self.__clip((lo + (first-lo) % period, hi, period), lo, hi)
+
+	def __remove_points(self, x, points, lo, hi):
+		"""
+		Return a list of simple ranges of the progression x without the values of points, a simple range within x
+		whose stride is a multiple of the stride of x (or None). x is cut at each of the points, except
+		when that would leave single values, then what is left is itself one progression.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+		if not points:
+			return [self.__simple(x)]
+		(x0, x1, sx) = x
+		(p0, p1, period) = points
+		if period == sx:						# every value of x is removed
+			return []
+		if period == 2*sx:						# every second value is left, they are one progression
+			t = self.__clip((p0-sx, x1, period), x0, x1)
+			return [self.__simple(t)] if t else []
+		lout = []
+		start = lo
+		for v in range(p0, p1+1, period):
+			t = self.__clip(x, start, v-1)
+			if t:
+				lout.append(self.__simple(t))
+			start = v+1
+		t = self.__clip(x, start, hi)
+		if t:
+			lout.append(self.__simple(t))
+		return lout
 
 	def __list_to_srange(self, input_list):
 		"""
@@ -444,6 +2113,10 @@ class srange:
 		if not r:
 			return []
 
+		l = self.__scan_string(r)
+		if l is not None:
+			return l
+
 		if r.find('@') > 0:
 			raise ValueError("Invalid character ('@') in string range.")
 
@@ -497,30 +2170,57 @@ class srange:
 
 		return l
 
-	def __resort_list(self):
-		""" Re-order the set of tuples in self.l to be montonic. """
+	def __scan_string(self, r):
+		"""
+		Fast form of __string_to_tuple_list(), all simple ranges are found by one regular expression scan.
+		Returns the same list, or None if r is not made of the usual simple ranges only (e.g. it has
+		"+5", "1-10:" or an error), then the general parsing of __string_to_tuple_list() must be used.
+		"""
+		if r[-1] == ',':						# an empty simple range at the end
+			return None
+		MAXINT = self.MAXINT
+		l = []
+		for (lo, hi, stride, other) in _SIMPLE_RANGE.findall(r):
+			if other:
+				return None
+			lo = int(lo) if lo[-1] not in 'fF' else (-MAXINT if lo[0] == '-' else MAXINT)
+			if hi:
+				hi = int(hi) if hi[-1] not in 'fF' else (-MAXINT if hi[0] == '-' else MAXINT)
+				stride = int(stride) if stride else 1
+				if stride > 1:
+					hi -= (hi-lo) % stride		# ensure that hi matches with stride, remove excess
+			else:
+				(hi, stride) = (lo, 1)
+			l.append((lo, hi, stride))
+		return l
+
+	def __resort_list(self, l):
+		"""
+		Return the set of tuples in l re-ordered to be montonic.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
 
 		loVals = []								# a list of the lo values
-		for l in self.l:						# first produces the sorted indicies
-			loVals.append(l[0])
+		for t in l:								# first produces the sorted indicies
+			loVals.append(t[0])
 		ii = sorted(range(len(loVals)), key=loVals.__getitem__)
 
 		lnew = []
 		for i in ii:							# rebuild a sorted list from indicies
-			lnew.append(self.l[i])
-		self.l = lnew
+			lnew.append(l[i])
+		return lnew
 
-	def __is_monotonic(self):
+	def __is_monotonic(self, l):
 		"""
-		Return True if the tuple list self.l is monotonic, False otherwise.
+		Return True if the tuple list l is monotonic, False otherwise.
 		An empty range is assume to be monotonic.
-		This method does not change any internal variables, e.g. no self.xxxx
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
 		"""
 
-		try:	last_hi = int((self.l[0])[0]) - 1
+		try:	last_hi = int((l[0])[0]) - 1
 		except:	return True						# empty range is assumed monotonic.
 
-		for (lo, hi, stride) in self.l:
+		for (lo, hi, stride) in l:
 			if (hi < lo) or (stride < 1) or (last_hi >= lo):
 				return False
 			last_hi = hi
@@ -615,7 +2315,76 @@ class srange:
 			ltemp.append(l[i+i0])
 
 		# second, see if you can concatenate any simple ranges having the same stride
-		# only combine ranges if one of them has hi>lo, do not combine two single number ranges.
+		return self.__join_neighbours(ltemp)
+
+	def __compact_optimal(self, l):
+		"""
+		Return the fewest simple ranges that hold the values of the monotonic list of simple ranges l, None if l is empty.
+		The differences between consecutive values form runs of equal differences (at most 2 for each simple range
+		of l). A simple range can not hold differences from two runs, so at each place where two runs meet,
+		the difference on one side must be cut (its two values go to different simple ranges). Every cut adds one
+		simple range, so the fewest cuts are a minimum vertex cover of the chains of runs with a single difference,
+		which is every second difference along each chain. This is O(k), no values are expanded.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> print (self.__compact_optimal([(1, 1, 1), (3, 3, 1), (5, 5, 1), (6, 6, 1), (7, 7, 1), (8, 8, 1)]))
+			[(1, 5, 2), (6, 8, 1)]
+		"""
+
+		if not l: return None
+
+		runs = []								# [difference, number of differences, first value] of each run
+		previous = None
+		for (lo, hi, stride) in l:
+			pieces = [(lo - previous, 1, previous)] if previous is not None else []
+			if hi > lo:
+				pieces.append((stride, (hi-lo)//stride, lo))
+			for (d, n, v) in pieces:
+				if runs and runs[-1][0] == d:
+					runs[-1][1] += n
+				else:
+					runs.append([d, n, v])
+			previous = hi
+		if not runs:							# only one value
+			return [l[0]]
+
+		# A run with one difference links the meeting places on both of its sides into a chain, cut every second
+		# difference along each chain. A longer run ends a chain with its first difference, its last one is never cut.
+		cut = [False] * len(runs)				# cut[r] is True if the first difference of run r is cut
+		chain = []
+		for (r, run) in enumerate(runs):
+			chain.append(r)
+			if run[1] > 1:
+				for c in chain[1::2]:
+					cut[c] = True
+				chain = [None]					# the last difference of run r starts the next chain, it is not cut
+		for c in chain[1::2]:
+			cut[c] = True
+
+		lnew = []
+		cut_before = True						# True if the difference before v is cut, or there is none
+		for (r, (d, n, v)) in enumerate(runs):
+			if cut[r] and cut_before:			# v is between two cut differences
+				lnew.append((v, v, 1))
+			if n == 1 and cut[r]:				# the value after v goes with the next run
+				cut_before = True
+			else:								# the rest of the run, at least one difference
+				lnew.append((v + cut[r]*d, v + n*d, d))
+				cut_before = False
+		if cut_before:							# the last value is after a cut difference
+			end = runs[-1][2] + runs[-1][0]*runs[-1][1]
+			lnew.append((end, end, 1))
+		return lnew
+
+	def __join_neighbours(self, ltemp):
+		"""
+		Return the list ltemp (not empty) with neighbouring simple ranges joined when they have the same stride.
+		This is the second step of __compact(), it only combines ranges if one of them has hi>lo,
+		two single number ranges are not combined.
+		This method neither uses nor changes any internal variables, e.g. no self.xxxx
+		"""
+
 		lnew = []
 		(last_lo, last_hi, last_stride) = ltemp[0]
 		last_single = last_lo==last_hi
@@ -636,3 +2405,167 @@ class srange:
 
 		lnew.append((last_lo,last_hi,last_stride))							# append the last one
 		return lnew
+
+
+class srange_iterator(itertools.chain):
+	"""
+	Iterator over all of the values in an srange.
+
+	Each srange_iterator keeps its own position, independent of srange.previous_item and of any
+	other iterator on the same srange. The values are produced by chaining one native range()
+	per simple range, so the iteration itself runs at C speed.
+
+	EXAMPLE::
+		>>> sr = srange("1-3,7")
+		>>> for i in srange_iterator(sr):
+				for j in srange_iterator(sr): print ((i,j)),
+		(1, 1) (1, 2) (1, 3) (1, 7) (2, 1) ... (7, 7)
+	"""
+
+	def __new__(cls, sr, reverse=False):
+		"""
+		Make a new iterator over the values of sr (an srange), going from last to first if reverse is True.
+		The iterator uses the simple ranges that sr has when it is created.
+		"""
+		if reverse:
+			return cls.from_iterable(range(hi, lo-1, -stride) for (lo, hi, stride) in sr._segments(reverse=True))
+		return cls.from_iterable(range(lo, hi+1, stride) for (lo, hi, stride) in sr._segments())
+
+
+class srange_builder(object):
+	"""
+	Build an srange one value (or one simple range) at a time.
+
+	Values must be added in increasing order. They are compacted as they arrive, using the same
+	rules as srange.__compact(), so the builder only holds the finished simple ranges plus the
+	last few values that might still join a run. Each append is O(1) and build() makes the srange
+	directly from the simple ranges, without going through a string.
+
+	EXAMPLE::
+		>>> b = srange_builder()
+		>>> for frame in (1, 2, 3, 5, 7, 9, 20): b.append(frame)
+		>>> b.append((30, 40, 5))
+		>>> print (b.build())
+		1-3,5-9:2,20,30-40:5
+
+	======================= ===================================================================================
+	methods                    action
+	======================= ===================================================================================
+	append(value)           add one value, or one simple range given as a tuple (lo,hi,stride)
+	extend(values)          add each of the values (integers or tuples), or all of the simple ranges of an srange
+	build()                 return a new srange with everything added so far, the builder can still be used
+	len()                   number of values added so far, also len(builder)
+	======================= ===================================================================================
+	"""
+
+	def __init__(self, auto_reset=True):
+		"""
+		Initialize an empty builder, auto_reset is passed to the srange made by build().
+		"""
+		self.auto_reset = auto_reset
+		self.__l = []							# finished simple ranges
+		self.__last = None						# simple range that may still join with what comes next
+		self.__count = 0						# number of singles in the current run, 0 after a complex range
+		self.__start = None						# first value of the current run
+		self.__end = None						# last value of the current run
+		self.__stride = None					# stride of the current run, once it has 2 values
+		self.__hi = None						# highest value added so far
+		self.__length = 0						# number of values added so far
+
+	def __len__(self):
+		""" Return the number of values added so far. """
+		return self.__length
+
+	def len(self):
+		""" Return the number of values added so far. """
+		return self.__length
+
+	def append(self, value):
+		"""
+		Add one value, or a simple range given as the tuple (lo,hi,stride), to the end of the builder.
+		The value (or lo) must be greater than everything that was already added.
+		"""
+		if isinstance(value, tuple):
+			try:	(lo, hi, stride) = value
+			except:	raise ValueError("A simple range must be a tuple (lo,hi,stride), not %r" % (value,))
+		else:
+			(lo, hi, stride) = (value, value, 1)
+		if not all(isinstance(v, srange.intTypes) for v in (lo, hi, stride)):
+			raise TypeError("Values must be integers, not %r" % (value,))
+		elif stride < 1 or hi < lo:
+			raise ValueError("stride is not a positive integer, or hi<lo in simple range %r" % (value,))
+		elif self.__hi is not None and lo <= self.__hi:
+			raise ValueError("Values must be added in increasing order, %r is not greater than %r" % (lo, self.__hi))
+
+		hi -= (hi-lo) % stride					# ensure that hi matches with stride, remove excess
+		self.__hi = hi
+		self.__length += (hi-lo)//stride + 1
+		if lo == hi:
+			self.__add_single(lo)
+		else:
+			self.__end_run()
+			self.__join((lo, hi, stride))
+
+	def extend(self, values):
+		"""
+		Add each item of values, integers or tuples (lo,hi,stride), as in append().
+		If values is an srange, all of its simple ranges are added.
+		"""
+		if isinstance(values, srange):
+			values = values.l or []
+		for value in values:
+			self.append(value)
+
+	def build(self):
+		""" Return a new srange holding everything added so far, the builder is not changed. """
+		saved = (self.__l, self.__last, self.__count)
+		self.__l = list(self.__l)				# finish a copy, so more values can still be added
+		self.__end_run()
+		if self.__last is not None:
+			self.__l.append(self.__last)
+		l = self.__l
+		(self.__l, self.__last, self.__count) = saved
+		return srange._from_tuple_list(l, auto_reset=self.auto_reset, compact=False)
+
+	def __add_single(self, v):
+		""" Add the single value v, this is the first step of srange.__compact() done one value at a time. """
+		if self.__count == 0:					# start a new run
+			self.__count, self.__start = 1, v
+		elif self.__count == 1:
+			self.__count, self.__stride = 2, v - self.__end
+		elif v - self.__end == self.__stride:	# accumulate more in this stride
+			self.__count += 1
+		else:									# done with this run, v starts the next one
+			self.__end_run()
+			self.__count, self.__start = 1, v
+		self.__end = v
+
+	def __end_run(self):
+		""" Pass the current run on to __join(), as one simple range if it has 3 or more values, otherwise as singles. """
+		if self.__count > 2:
+			self.__join((self.__start, self.__end, self.__stride))
+		elif self.__count == 2:
+			self.__join((self.__start, self.__start, 1))
+			self.__join((self.__end, self.__end, 1))
+		elif self.__count == 1:
+			self.__join((self.__start, self.__start, 1))
+		self.__count = 0
+
+	def __join(self, t):
+		""" Join t to the previous simple range if possible, this is srange.__join_neighbours() done one range at a time. """
+		if self.__last is None:
+			self.__last = t
+			return
+		(last_lo, last_hi, last_stride) = self.__last
+		(lo, hi, stride) = t
+		last_single = last_lo == last_hi
+		single = lo == hi
+		if single and (not last_single) and last_hi+last_stride == lo:		# last complex joins current single
+			self.__last = (last_lo, hi, last_stride)
+		elif (not single) and last_single and last_hi+stride == lo:			# last single joins current complex
+			self.__last = (last_lo, hi, stride)
+		elif (not single) and (not last_single) and last_hi+stride == lo and stride == last_stride:	# join two complex
+			self.__last = (last_lo, hi, last_stride)
+		else:
+			self.__l.append(self.__last)
+			self.__last = t
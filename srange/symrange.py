@@ -9,6 +9,8 @@
 #
 
 import sys
+import itertools
+from .srange import _numpy
 
 __version__	=	"$Revision: $"
 __author__	=	"Jon Tischler, <tischler@aps.anl.gov>" +\
@@ -44,7 +46,7 @@ class symrange:
 	====================    ===========================================================================================
 	self.endVal             the highest value +/- returned, this is always >= 0
 	self.negativeFirst      if True then 0,-1,+1,-2,+2,...   Otherwise 0,+1,-1,+2,-2,...
-	self.auto_reset         if True (default), then previous is reset to None at each call to __iter__
+	self.auto_reset         if True (default), each __iter__ returns a new symrange_iterator, if False iteration continues from previous
 	self.length             total number of items in range, you can also get this from len(symrange(n)) or symrange(n).len()
 	self.previous           last value returned by the iterator, when previous==None, then a call to next() returns 0
 	====================    ===========================================================================================
@@ -60,6 +62,11 @@ class symrange:
 	index(ipnt)             return the ipntth number from range, first number is ipnt==0, returns None if ipnt negative or too big, same as symrange(2)[ipnt]
 	val2index(m)            returns index into range that corresponds to m. e.g. for r='0,-1,1,-2,2', m=1 returns 2.
 	list(self)              returns a list where each element is a value in the range, CAUTION this can make a VERY big list if n is large
+	to_array(dtype,out)     returns a numpy array of all values in the range (needs numpy)
+	iter_chunks(size,...)   generator of consecutive blocks of up to size values, as numpy arrays or as lists
+	parallel_map(func,...)  generator of func(value) for each value, run on a thread or process pool in chunks
+	parallel_for(func,...)  call func(value) for each value on a thread or process pool, discard the results
+	amap(coro_fn,...)       async generator of await coro_fn(value) for each value, with bounded concurrency
 	====================    ===========================================================================================
 
 	=====================   ======================== ===================================================================
@@ -93,12 +100,22 @@ class symrange:
 
 
 	def __iter__(self):
-		""" The class iterator """
+		"""
+		The class iterator.
+		When auto_reset is True, this returns a new symrange_iterator with its own position,
+		so nested loops (or threads) over the same symrange do not interfere, previous is not changed.
+		When auto_reset is False, the symrange itself is returned and iteration continues from previous.
+		"""
 		if self.auto_reset:
-			self.previous = None			# flags new iteration, next value will be zero, the default
+			return symrange_iterator(self)
 		return self
 
 
+	def __next__(self):						# this is required for python3 iterator
+		""" Return the next value in the symrange. """
+		return self.next()
+
+
 	def next(self):
 		""" Return the next value in the symrange. """
 		if self.previous is None:			# at start
@@ -161,7 +178,7 @@ class symrange:
 		elif n >= self.length:
 			val = None
 		else:
-			val = (n+1) / 2					# positive value
+			val = (n+1) // 2				# positive value
 			isign = n % 2
 			if self.negativeFirst and isign:	val = -val
 			elif not self.negativeFirst and not isign:	val = -val
@@ -227,6 +244,118 @@ class symrange:
 		return lout
 
 
+	def to_array(self, dtype=None, out=None):
+		"""
+		Expands the symrange into a numpy array, numpy must be available.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		dtype is the type of the new array, the default is numpy.int64.
+		If out is given, it must be a 1-d numpy array with length self.length, it is filled and returned (dtype is ignored).
+		The positive and negative values are each written with one strided slice assignment.
+
+		EXAMPLE::
+			>>> print (symrange(2).to_array())
+			[ 0  1 -1  2 -2]
+		"""
+		np = _numpy()
+		if out is None:
+			out = np.empty(self.length, dtype=(np.int64 if dtype is None else dtype))
+		elif out.shape != (self.length,):
+			raise ValueError("out must be a 1-d array of length %d, not shape %r" % (self.length, out.shape))
+
+		out[0] = 0
+		pos = np.arange(1, self.endVal+1, dtype=out.dtype)
+		if self.negativeFirst:
+			out[1::2] = -pos
+			out[2::2] = pos
+		else:
+			out[1::2] = pos
+			out[2::2] = -pos
+		return out
+
+
+	def iter_chunks(self, size, as_array=True):
+		"""
+		Generator that returns consecutive blocks of at most size values from the symrange.
+		If as_array is True (default) each block is a numpy int64 array (this needs numpy) computed from the
+		indices of the block, otherwise each block is a list of values taken from one symrange_iterator.
+		This method uses but does not change any internal variables, e.g. no self.xxxx
+
+		EXAMPLE::
+			>>> for chunk in symrange(2).iter_chunks(2, as_array=False): print (chunk)
+			[0, 1]
+			[-1, 2]
+			[-2]
+		"""
+		try:	size = int(size)
+		except:	raise TypeError('size = %r is not an integer' % size)
+		if size < 1:
+			raise ValueError('size must be positive, not %r' % size)
+
+		if as_array:
+			np = _numpy()
+			for start in range(0, self.length, size):
+				n = np.arange(start, min(start+size, self.length), dtype=np.int64)
+				val = (n+1) // 2				# the absolute value, then set the signs
+				if self.negativeFirst:	val[n % 2 == 1] *= -1
+				else:					val[n % 2 == 0] *= -1
+				yield val
+		else:
+			it = symrange_iterator(self)
+			while True:
+				chunk = list(itertools.islice(it, size))
+				if not chunk:
+					break
+				yield chunk
+
+
+	def __aiter__(self):
+		""" Return an asynchronous iterator over the values, so that "async for value in syr:" works. """
+		from . import parallel
+		return parallel.async_values(symrange_iterator(self))
+
+
+	def amap(self, coro_fn, concurrency=8):
+		"""
+		Asynchronous generator that yields await coro_fn(value) for each value in the symrange, in order,
+		with up to concurrency coroutines running at the same time, see srange.amap().
+		"""
+		from . import parallel
+		return parallel.async_map(symrange_iterator(self), coro_fn, concurrency)
+
+
+	def parallel_map(self, func, executor=None, chunk=None, ordered=True, max_pending=None, max_workers=None):
+		"""
+		Generator that yields func(value) for each value in the symrange, computed on a pool of threads or processes.
+		Each chunk is sent to the pool as this symrange and a range of positions, not as a list of values.
+		The arguments are the same as for srange.parallel_map().
+
+		EXAMPLE::
+			>>> print (list(symrange(2).parallel_map(abs)))
+			[0, 1, 1, 2, 2]
+		"""
+		from . import parallel					# imported on first use, it needs concurrent.futures
+		if chunk is None:
+			chunk = parallel.default_chunk(self.length)
+		try:	chunk = int(chunk)
+		except:	raise TypeError('chunk = %r is not an integer' % chunk)
+		if chunk < 1:
+			raise ValueError('chunk must be positive, not %r' % chunk)
+		tasks = ((parallel.call_each_index, func, self, range(a, min(a+chunk, self.length)))
+			for a in range(0, self.length, chunk))
+		return parallel.chunk_map(tasks, executor=executor, ordered=ordered, max_pending=max_pending, max_workers=max_workers)
+
+
+	def parallel_for(self, func, executor=None, chunk=None, max_pending=None, max_workers=None):
+		"""
+		Call func(value) for each value in the symrange on a pool of threads or processes, the results are discarded.
+		This is parallel_map() without the results, see srange.parallel_for().
+		"""
+		for result in self.parallel_map(func, executor=executor, chunk=chunk, ordered=False,
+				max_pending=max_pending, max_workers=max_workers):
+			pass
+
+
 	def __len__(self):
 		""" This allows use of   len(symrange(3)) syntax """
 		return self.length
@@ -248,3 +377,20 @@ class symrange:
 		""" Return printable representation for a symrange. """
 		return 'symrange[endVal=%r, negativeFirst=%r, previous=%r, len=%r, auto_reset=%r]' % (self.endVal, self.negativeFirst, self.previous, self.length, self.auto_reset)
 
+
+class symrange_iterator(itertools.chain):
+	"""
+	Iterator over all of the values in a symrange.
+
+	Each symrange_iterator keeps its own position, independent of symrange.previous and of any
+	other iterator on the same symrange. The values are produced by chaining native range()
+	objects, so the iteration itself runs at C speed.
+	"""
+
+	def __new__(cls, syr):
+		""" Make a new iterator over the values of syr (a symrange). """
+		pos = range(1, syr.endVal+1)
+		neg = range(-1, -syr.endVal-1, -1)
+		if syr.negativeFirst:	pairs = zip(neg, pos)
+		else:					pairs = zip(pos, neg)
+		return cls.from_iterable(itertools.chain(((0,),), pairs))
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#
+# srange_bench.py
+#
+# Part of the "pydiffract" package
+#
+
+"""
+Benchmarks of the hot paths of srange and symrange.
+
+Each benchmark is timed over inputs from 1e3 to 1e7 values and from 1 to 1e5 simple ranges
+(sizes above --max-size are skipped). The best of several runs is kept. The results can be saved
+as a JSON baseline, and a later run can be compared against it. A case that is slower than the
+baseline by more than --threshold is flagged as a regression, and the exit status is then 1.
+Everything runs offline, and numpy is only used (for from_array) when it is installed.
+
+Examples:
+	./srange_bench.py							# run all benchmarks up to 1e6 values, print a table
+	./srange_bench.py --save base.json			# also write the results to base.json
+	./srange_bench.py --compare base.json		# compare against base.json, flag regressions
+	./srange_bench.py --max-size 1e7 parse iterate	# only the parse and iterate benchmarks, up to 1e7 values
+"""
+
+import sys
+import json
+import pickle
+import random
+import argparse
+import platform
+from time import perf_counter
+from collections import OrderedDict
+
+from srange import srange, symrange
+
+SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)			# number of values
+SEGMENTS = (1, 10, 100, 1000, 10**4, 10**5)			# number of simple ranges
+N_QUERIES = 1000									# number of random queries per lookup benchmark
+BENCHMARKS = OrderedDict()							# name -> function(max_size), yields (params, setup)
+
+
+def benchmark(func):
+	"""
+	Register a benchmark, func(max_size) yields (params, setup), setup() returns the callable to time,
+	or a tuple (callable, extra) where extra is a dict of more numbers to store with the result (e.g. sizes).
+	"""
+	BENCHMARKS[func.__name__] = func
+	return func
+
+
+def make_list(n, k):
+	"""
+	Return a sorted list of n values in k simple ranges, the strides alternate between 1 and 3
+	(with gaps between them) so that compaction can not join neighbouring simple ranges.
+	"""
+	k = max(1, min(k, n))
+	values = []
+	start = 0
+	for i in range(k):
+		count = n // k + (1 if i < n % k else 0)
+		stride = 1 if i % 2 else 3
+		values.extend(range(start, start + count*stride, stride))
+		start += count*stride + 5
+	return values
+
+
+def make_string(n, k):
+	""" Return the range string of make_list(n, k). """
+	return str(srange(make_list(n, k)))
+
+
+def make_srange(n, k):
+	""" Return an srange with n values in k simple ranges. """
+	return srange(make_string(n, k))
+
+
+@benchmark
+def parse(max_size):
+	""" srange(string) for strings of 1 to 1e5 simple ranges, 10 values in each """
+	for k in SEGMENTS:
+		if 10*k <= max_size:
+			yield ({'n': 10*k, 'segments': k}, lambda k=k: (lambda s=make_string(10*k, k): srange(s)))
+
+
+@benchmark
+def from_list(max_size):
+	""" srange(list) from lists of 1e3 to 1e7 values in 10 simple ranges """
+	for n in SIZES:
+		if n <= max_size:
+			yield ({'n': n, 'segments': 10}, lambda n=n: (lambda l=make_list(n, 10): srange(l)))
+
+
+@benchmark
+def from_array(max_size):
+	""" srange.from_array(numpy array) of 1e3 to 1e7 values in 10 simple ranges, needs numpy """
+	try:
+		import numpy
+	except ImportError:
+		return
+	for n in SIZES:
+		if n <= max_size:
+			yield ({'n': n, 'segments': 10},
+				lambda n=n: (lambda a=numpy.array(make_list(n, 10), dtype=numpy.int64): srange.from_array(a)))
+
+
+@benchmark
+def compact(max_size):
+	"""
+	srange(list) on inputs that are bad for __compact: pairs of values (1,2, 4,5, 7,8, ...) that are
+	never joined, and sorted random values, which are mostly singles. Up to 1e5 values each.
+	"""
+	for n in SIZES:
+		if n <= min(max_size, 10**5):
+			pairs = lambda n=n: (lambda l=[v for p in range(0, 3*n//2, 3) for v in (p, p+1)]: srange(l))
+			yield ({'n': n, 'segments': n//2, 'input': 'pairs'}, pairs)
+			randoms = lambda n=n: (lambda l=sorted(random.Random(n).sample(range(10*n), n)): srange(l))
+			yield ({'n': n, 'segments': n, 'input': 'random'}, randoms)
+
+
+@benchmark
+def compaction(max_size):
+	"""
+	srange(list) with the greedy and the optimal compaction, on pairs of values (1,2, 4,5, ...) and on
+	sorted random values, up to 1e5 values. The number of simple ranges made is stored as 'segment_count'.
+	"""
+	for n in SIZES:
+		if n <= min(max_size, 10**5):
+			inputs = (('pairs', [v for p in range(0, 3*n//2, 3) for v in (p, p+1)]),
+				('random', sorted(random.Random(n).sample(range(3*n), n))))
+			for (name, values) in inputs:
+				for mode in ('greedy', 'optimal'):
+					def setup(values=values, mode=mode):
+						return (lambda: srange(values, compaction=mode),
+							{'segment_count': srange(values, compaction=mode).segment_count()})
+					yield ({'n': n, 'input': name, 'compaction': mode}, setup)
+
+
+@benchmark
+def iterate(max_size):
+	""" for i in sr, over 1e3 to 1e7 values in 100 simple ranges """
+	def run(sr):
+		for i in sr:
+			pass
+	for n in SIZES:
+		if n <= max_size:
+			yield ({'n': n, 'segments': 100}, lambda n=n: (lambda sr=make_srange(n, 100): run(sr)))
+
+
+def lookups(max_size, method):
+	""" Yield the cases of N_QUERIES random calls of method, over 1 to 1e5 simple ranges of max_size values """
+	n = min(max_size, 10**6)
+	for k in SEGMENTS:
+		if k <= n:
+			def setup(k=k):
+				sr = make_srange(n, k)
+				rnd = random.Random(k)
+				if method == 'index':
+					queries = [rnd.randrange(n) for i in range(N_QUERIES)]
+				else:
+					last = sr.last()
+					queries = [rnd.randrange(last + 1) for i in range(N_QUERIES)]
+				func = getattr(sr, method)
+				def run():
+					for q in queries:
+						func(q)
+				return run
+			yield ({'n': n, 'segments': k, 'queries': N_QUERIES}, setup)
+
+
+@benchmark
+def index(max_size):
+	""" 1000 random sr.index(n) """
+	return lookups(max_size, 'index')
+
+
+@benchmark
+def val2index(max_size):
+	""" 1000 random sr.val2index(val) """
+	return lookups(max_size, 'val2index')
+
+
+@benchmark
+def is_in_range(max_size):
+	""" 1000 random sr.is_in_range(val) """
+	return lookups(max_size, 'is_in_range')
+
+
+@benchmark
+def symrange_iterate(max_size):
+	""" for i in symrange(n//2), over 1e3 to 1e7 values """
+	def run(syr):
+		for i in syr:
+			pass
+	for n in SIZES:
+		if n <= max_size:
+			yield ({'n': n}, lambda n=n: (lambda syr=symrange(n//2): run(syr)))
+
+
+@benchmark
+def serialize(max_size):
+	"""
+	Encode and decode sranges of 1 to 1e5 simple ranges (10 values in each) as a string (str() and srange(string)),
+	with to_bytes() and from_bytes(), and with pickle. The size of the encoded form is stored as 'bytes'.
+	"""
+	def string_encode(sr):
+		sr.r = None							# drop the cached string, so str() makes it again
+		return str(sr)
+	formats = (
+		('string', string_encode, lambda data: srange(data), lambda data: len(data.encode())),
+		('bytes', lambda sr: sr.to_bytes(), srange.from_bytes, len),
+		('pickle', lambda sr: pickle.dumps(sr, pickle.HIGHEST_PROTOCOL), pickle.loads, len))
+	for k in SEGMENTS:
+		if 10*k > max_size:
+			continue
+		for (fmt, encode, decode, size) in formats:
+			def setup_encode(k=k, encode=encode, size=size):
+				sr = make_srange(10*k, k)
+				return (lambda: encode(sr), {'bytes': size(encode(sr))})
+			def setup_decode(k=k, encode=encode, decode=decode, size=size):
+				data = encode(make_srange(10*k, k))
+				return (lambda: decode(data), {'bytes': size(data)})
+			yield ({'n': 10*k, 'segments': k, 'format': fmt, 'direction': 'encode'}, setup_encode)
+			yield ({'n': 10*k, 'segments': k, 'format': fmt, 'direction': 'decode'}, setup_decode)
+
+
+def case_key(name, params):
+	""" The key of a benchmark case in the results, e.g. 'iterate[n=1000,segments=100]' """
+	return '%s[%s]' % (name, ','.join('%s=%s' % (key, params[key]) for key in sorted(params)))
+
+
+def time_it(func, min_time=0.2, max_repeat=1000):
+	""" Return the best time in seconds of a call of func(), repeated until min_time has passed (at least 3 times) """
+	best = None
+	total = 0.
+	for i in range(max_repeat):
+		t0 = perf_counter()
+		func()
+		dt = perf_counter() - t0
+		best = dt if best is None else min(best, dt)
+		total += dt
+		if i >= 2 and total >= min_time:
+			break
+	return best
+
+
+def run(names, max_size, min_time):
+	""" Run the named benchmarks, return an OrderedDict of case key -> {'seconds':..., params..., extra...} """
+	results = OrderedDict()
+	for name in names:
+		for (params, setup) in BENCHMARKS[name](max_size):
+			key = case_key(name, params)
+			func = setup()
+			extra = {}
+			if isinstance(func, tuple):
+				(func, extra) = func
+			seconds = time_it(func, min_time)
+			results[key] = dict(params, seconds=seconds, **extra)
+			print ('  %-70s %12.6f s%s' % (key, seconds, ''.join('  %s=%s' % item for item in sorted(extra.items()))))
+			sys.stdout.flush()
+	return results
+
+
+def compare(results, baseline, threshold):
+	""" Print the ratio of each result to the baseline, return the number of regressions """
+	regressions = 0
+	print ('\n%-72s %12s %12s %8s' % ('compared to baseline', 'baseline', 'now', 'ratio'))
+	for (key, result) in results.items():
+		if key not in baseline:
+			print ('  %-70s %12s %12.6f %8s' % (key, '-', result['seconds'], 'new'))
+			continue
+		old = baseline[key]['seconds']
+		ratio = result['seconds'] / old if old > 0 else float('inf')
+		flag = ''
+		if ratio > threshold:
+			flag = '  REGRESSION'
+			regressions += 1
+		elif ratio < 1./threshold:
+			flag = '  faster'
+		print ('  %-70s %12.6f %12.6f %8.2f%s' % (key, old, result['seconds'], ratio, flag))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+	parser.add_argument('names', nargs='*', help='benchmarks to run (default all): ' + ', '.join(BENCHMARKS))
+	parser.add_argument('--max-size', type=float, default=1e6, help='skip inputs with more values than this (default 1e6)')
+	parser.add_argument('--min-time', type=float, default=0.2, help='minimum time spent on each case in seconds (default 0.2)')
+	parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline to FILE')
+	parser.add_argument('--compare', metavar='FILE', help='compare the results with the JSON baseline in FILE')
+	parser.add_argument('--threshold', type=float, default=1.25,
+		help='a case slower than the baseline by more than this ratio is a regression (default 1.25)')
+	args = parser.parse_args(argv)
+
+	unknown = [name for name in args.names if name not in BENCHMARKS]
+	if unknown:
+		parser.error('unknown benchmarks %s, choose from %s' % (', '.join(unknown), ', '.join(BENCHMARKS)))
+	baseline = None
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['results']
+
+	print ('srange benchmarks,  python %s' % platform.python_version())
+	results = run(args.names or list(BENCHMARKS), int(args.max_size), args.min_time)
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+				'max_size': int(args.max_size), 'results': results}, f, indent=1)
+		print ('\nresults written to %s' % args.save)
+	if baseline is not None:
+		regressions = compare(results, baseline, args.threshold)
+		print ('\n%d regressions' % regressions)
+		return 1 if regressions else 0
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
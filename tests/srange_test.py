@@ -8,8 +8,11 @@
 # Part of the "pydiffract" package
 #
 
+import os
 import sys
-from srange import srange
+import pickle
+import tempfile
+from srange import srange, srange_builder
 
 __version__	=	"$Revision: $"
 __author__	=	"Jon Tischler, <tischler@aps.anl.gov>" +\
@@ -29,6 +32,11 @@ Testing Examples:
 	./srange_test.py 1			# runs first testGroup (1)
 	./srange_test.py 5			# runs first and third testGroup (1+4=5)
 	./srange_test.py 2			# runs second testGroup (1)
+	./srange_test.py 8			# runs the set operation tests (union, intersection, ..., add, discard)
+	./srange_test.py 16			# runs the srange_builder tests
+	./srange_test.py 32			# runs the asyncio tests (async for, amap)
+	./srange_test.py 64			# runs the instrumentation tests (set_stats)
+	./srange_test.py 128		# runs the parallel_map and parallel_for tests
 	./srange_test.py -1			# runs all testGroups
 """
 
@@ -57,18 +65,49 @@ def test(test_str, bad=False):
 			mystr += str(val) + ', '
 		print ('Elements of str1: ', mystr)
 		print ('Python list of elements in str1:', sr.list())
+		try:	print ('numpy array of elements in str1:', sr.to_array())
+		except ImportError:	pass
 		print ('  internal representation: ', sr.l)
 		print ('String representation:', repr(sr))
 		print ('String value:', str(sr))
 		print ('first and last elements are [%g, %g], %g elements' % (sr.first(), sr.last(), sr.len()))
 		print ('Next element after 5:', sr.after(5))
 		print ('Next element after 16:', sr.after(16))
+		print ('Element before 5, and all elements in reverse:', sr.before(5), list(reversed(sr)))
 		print ('Test if 5 is in range:', sr.is_in_range(5))
 		print ('Test if 6 is in range:', sr.is_in_range(6))
+		try:	print ('Test if 4,5,6 are in range:', sr.contains_many([4, 5, 6]))
+		except ImportError:	pass
 		print ('Subrange from -1 with 100 elements: ', sr.sub_range(-1,100))
 		print ('Subrange from 3 with 5 elements: ', sr.sub_range(3,5))
+		print ('Last element, and every second element:', sr[-1], sr[::2])
 		print ('Index of 5 in string range:', sr.val2index(5))
 		print ('Value at index 3 in string range:', sr.index(3))
+		try:	print ('Indices of 3,5,6 and value at index 0:', sr.val2index_many([3, 5, 6]), sr.index_many([0]))
+		except ImportError:	pass
+		print ('Chunks of 4 elements:', list(sr.iter_chunks(4, as_array=False)))
+		b = sr.to_bytes()
+		print ('As %d bytes: %r, back from bytes: %s' % (len(b), b, srange.from_bytes(b)))
+		if srange.from_bytes(b).l != sr.l or pickle.loads(pickle.dumps(sr)).l != sr.l:
+			TotalErrorCount += 1
+			print ('ERROR -- from_bytes(to_bytes()) or pickle did not give back the same range')
+		path = os.path.join(tempfile.gettempdir(), 'srange_test_%d.src' % os.getpid())
+		try:
+			sr.to_file(path)
+			mapped = srange.open_file(path)
+			print ('From a mapped file: %s, value at index 3: %r' % (mapped, mapped.index(3)))
+			if mapped.l != sr.l or mapped.index(3) != sr.index(3) or mapped.val2index(5) != sr.val2index(5):
+				TotalErrorCount += 1
+				print ('ERROR -- open_file(to_file()) did not give back the same range')
+			other = srange('4-9,12')				# set operations read only the part of the file they need
+			if [(mapped | other).list(), (mapped & other).list(), (mapped - other).list(), (other ^ mapped).list(),
+					mapped.isdisjoint(other), other <= mapped] != [(sr | other).list(), (sr & other).list(),
+					(sr - other).list(), (other ^ sr).list(), sr.isdisjoint(other), other <= sr]:
+				TotalErrorCount += 1
+				print ('ERROR -- set operations on a mapped file do not agree with the same range in memory')
+			del mapped
+		finally:
+			if os.path.exists(path): os.remove(path)
 
 	except Exception as err:
 		if bad:
@@ -95,8 +134,98 @@ if testGroup & 1:
 	try:
 		import numpy
 		test(numpy.array([3,5,9,10,11,12]))	# numpy array instead of just a list
-	except:
+		arr = numpy.array([12,3,5,9,10,11,20,22,24,26])
+		print ('\nsrange.from_array(%r) = %s,  srange(...) = %s' % (arr, srange.from_array(arr), srange(arr)))
+		if str(srange.from_array(arr)) != str(srange(arr)):
+			TotalErrorCount += 1
+			print ('ERROR -- srange.from_array() and srange() disagree')
+		try:									# 2**64-1 would wrap around to -1 as int64
+			print ('srange.from_array() of a uint64 above the int64 maximum: %s' % srange.from_array(numpy.array([1, 2, 2**64-1], dtype=numpy.uint64)))
+			TotalErrorCount += 1
+			print ('ERROR -- srange.from_array() should have raised ValueError')
+		except ValueError as err:
+			print ('srange.from_array() of a uint64 above the int64 maximum raised ValueError: %s' % err)
+	except ImportError:
 		pass
+	for test_str in ('1,2,4,5,7,8', '1,2,3,5,7,9,10,11', '0-20:2,21,23,25'):
+		(greedy, optimal) = (srange(test_str), srange(test_str, compaction='optimal'))
+		print ('\n%r compacted greedy: %s (%d), optimal: %s (%d)' %
+			(test_str, greedy, greedy.segment_count(), optimal, optimal.segment_count()))
+		if optimal != greedy or optimal.segment_count() > greedy.segment_count():
+			TotalErrorCount += 1
+			print ('ERROR -- the optimal compaction changed the values or used more simple ranges')
+	try:
+		import numpy
+		for test_str in ('0-inf', '-inf-inf', '-inf--5,3-inf:7'):	# near MAXINT, with more than 2**63 values
+			sr = srange(test_str)
+			values = [-sr.MAXINT, -5, 0, 3, 10, sr.MAXINT-1, sr.MAXINT]
+			print ('\n%r contains_many: %r,  index_many([0, 1, 2]): %r' %
+				(test_str, sr.contains_many(values).tolist(), sr.index_many([0, 1, 2]).tolist()))
+			if sr.contains_many(values).tolist() != [sr.is_in_range(v) for v in values] or \
+					sr.index_many([0, 1, 2]).tolist() != [sr.index(n) for n in (0, 1, 2)]:
+				TotalErrorCount += 1
+				print ('ERROR -- contains_many() or index_many() disagree with is_in_range() or index()')
+		for method in ('contains_many', 'val2index_many', 'floor_many', 'ceil_many', 'nearest_many'):
+			try:								# 2**64-1 would wrap around to -1 as int64
+				getattr(srange('-5-5'), method)(numpy.array([3, 2**64-1], dtype=numpy.uint64))
+				TotalErrorCount += 1
+				print ('ERROR -- %s() of a uint64 value above the int64 maximum should raise ValueError' % method)
+			except ValueError:
+				pass
+	except ImportError:
+		pass
+	strings = ['1-5', '2,4,6', ' -inf--3, 7', '1-10:3', '1-5']
+	print ('\nsrange.parse_many(%r) = %r' % (strings, [str(sr) for sr in srange.parse_many(strings)]))
+	if [sr.l for sr in srange.parse_many(strings)] != [srange(r).l for r in strings]:
+		TotalErrorCount += 1
+		print ('ERROR -- srange.parse_many() and srange() disagree')
+	for (test_str, n) in (('1-10,20-23', 3), ('0-100:7,200', 4), ('5', 3), ('1-3', 5), ('', 2)):
+		sr = srange(test_str)
+		(parts, chunks) = (sr.split(n), sr.split_by(n))
+		print ('\n%r split(%d): %r,  split_by(%d): %r' % (test_str, n, [str(p) for p in parts], n, [str(p) for p in chunks]))
+		sizes = [p.len() for p in parts]
+		if sum([p.list() for p in parts], []) != sr.list() or len(parts) != n or max(sizes) - min(sizes) > 1:
+			TotalErrorCount += 1
+			print ('ERROR -- split(%d) should give %d pieces of nearly equal size that hold all of the values' % (n, n))
+		if sum([p.list() for p in chunks], []) != sr.list() or any(p.len() != n for p in chunks[:-1]) or \
+				not 0 < (chunks[-1].len() if chunks else n) <= n:
+			TotalErrorCount += 1
+			print ('ERROR -- split_by(%d) should give pieces of %d values (the last may have fewer) that hold all of the values' % (n, n))
+	for (name, arg, error) in (('split', 0, ValueError), ('split', 2.5, TypeError),
+			('split_by', 0, ValueError), ('split_by', '3', TypeError)):
+		try:
+			getattr(srange('1-10'), name)(arg)
+			TotalErrorCount += 1
+			print ('ERROR -- %s(%r) should have raised %s' % (name, arg, error.__name__))
+		except error as err:
+			print ('%s(%r) raised %s: %s' % (name, arg, error.__name__, err))
+
+	print ('\n---------------------------------------------')
+	old_size = srange.cache_info().maxsize
+	srange.set_cache_size(2)
+	srange.cache_clear()
+	srange('1-10,20-30:2')					# miss
+	a = srange('1-10,20-30:2')				# hit
+	a.add(15)								# must not change the cached columns
+	b = srange('1-10,20-30:2')				# hit
+	print ('cached string after add(): %s,  the changed srange: %s' % (b, a))
+	if b.list() != list(range(1, 11)) + list(range(20, 31, 2)):
+		TotalErrorCount += 1
+		print ('ERROR -- changing an srange with add() changed the cached values of its string')
+	for test_str in ('5-9', '7', '5-9', '1-10,20-30:2'):	# miss, miss (evicts '1-10,...'), hit, miss
+		srange(test_str)
+	srange('7', compaction='optimal')		# a different key, a miss that evicts '5-9'
+	print ('parse cache after 8 strings: %r' % (srange.cache_info(),))
+	if srange.cache_info() != (3, 5, 3, 2, 2):
+		TotalErrorCount += 1
+		print ('ERROR -- the parse cache should have been CacheInfo(hits=3, misses=5, evictions=3, maxsize=2, currsize=2)')
+	srange.set_cache_size(0)				# the cache is off, nothing is counted
+	srange('1-10,20-30:2')
+	srange.cache_clear()
+	if srange.cache_info() != (0, 0, 0, 0, 0):
+		TotalErrorCount += 1
+		print ('ERROR -- cache_clear() should leave CacheInfo(hits=0, misses=0, evictions=0, maxsize=0, currsize=0)')
+	srange.set_cache_size(old_size)
 
 if testGroup & 2:							# tests of stride
 	print ('\n\n========== Tests of string range with stride ==========\n\n')
@@ -115,6 +244,57 @@ if testGroup & 2:							# tests of stride
 	test('1-5:2, 7-7:-1', bad=True)			# a negative stride, not Allowed
 	test('1-5:1.1', bad=True)				# a non-integral stride, not Allowed
 
+	def test_neighbours(test_str):
+		"""
+		Test prev(), floor_many(), ceil_many() and nearest_many() of test_str against a search of its list of values.
+		"""
+		global TotalErrorCount
+		print ('\n---------------------------------------------')
+		sr = srange(test_str)
+		values = sr.list()
+		queries = list(range(values[0]-3, values[-1]+4)) if values else [-1, 0, 1]
+		backwards = []
+		sr.reset_previous(end=True)
+		try:
+			while True:
+				backwards.append(sr.prev())
+		except StopIteration:
+			pass
+		print ('%r backwards with prev(): %r' % (test_str, backwards))
+		errors = 0 if backwards == values[::-1] else 1
+		for q in queries:
+			sr.previous_item = q
+			try:	before = sr.prev()
+			except StopIteration:	before = None
+			if before != max([v for v in values if v < q] or [None]):
+				errors += 1
+		try:
+			import numpy
+			low = numpy.iinfo(numpy.int64).min
+			floor = [max([v for v in values if v <= q] or [low]) for q in queries]
+			ceil = [min([v for v in values if v >= q] or [low]) for q in queries]
+			print ('  floor_many: %r\n  ceil_many:  %r' % (sr.floor_many(queries).tolist(), sr.ceil_many(queries, missing=-99).tolist()))
+			errors += sr.floor_many(queries).tolist() != floor
+			errors += sr.ceil_many(queries).tolist() != ceil
+			errors += sr.floor_many(queries, missing=-99).tolist() != [-99 if f == low else f for f in floor]
+			errors += sr.ceil_many(queries, missing=-99).tolist() != [-99 if c == low else c for c in ceil]
+			if values:
+				errors += sr.nearest_many(queries).tolist() != [min(values, key=lambda v: (abs(v-q), v)) for q in queries]
+			else:
+				try:
+					sr.nearest_many(queries)
+					errors += 1
+				except ValueError:
+					pass
+		except ImportError:
+			pass
+		if errors:
+			TotalErrorCount += 1
+			print ('ERROR -- prev(), floor_many(), ceil_many() or nearest_many() disagree with the list of values')
+
+	for test_str in ('1-10:2', '1,3-7:2,9', '0-20:4,21,23-27:2', '-5--1:2,0,8', '5', ''):
+		test_neighbours(test_str)
+
 if testGroup & 4:							# tests of auto_reset
 	print ('\n\n========== Tests of string range with auto_reset ==========\n\n')
 	s = srange('5-7',auto_reset=True)
@@ -135,5 +315,186 @@ if testGroup & 4:							# tests of auto_reset
 	for i in s:
 		print ('  ',i)
 
+	print ('\n---------------------------------------------')
+	s = srange('1-3,7')
+	print (' nested loops over the same srange, each loop has its own iterator')
+	for i in s:
+		print ('  ', i, [j for j in s])
+
+if testGroup & 8:							# tests of set operations
+	print ('\n\n========== Tests of set operations on string ranges ==========\n\n')
+	def test_set(a, b):
+		"""
+		Test the set operations between the string ranges a and b, compare with python sets.
+		"""
+		global TotalErrorCount
+		print ('\n---------------------------------------------')
+		print ('The test inputs: %r and %r' % (a, b))
+		sa, sb = srange(a), srange(b)
+		for (name, result, expected) in (
+				('union', sa | sb, set(sa.list()) | set(sb.list())),
+				('intersection', sa & sb, set(sa.list()) & set(sb.list())),
+				('difference', sa - sb, set(sa.list()) - set(sb.list())),
+				('symmetric difference', sa ^ sb, set(sa.list()) ^ set(sb.list()))):
+			print ('  %-21s %s' % (name+':', result))
+			if result.list() != sorted(expected):
+				TotalErrorCount += 1
+				print ('ERROR -- %s should have been %r' % (name, sorted(expected)))
+		(pa, pb) = (set(sa.list()), set(sb.list()))
+		compared = (sa == sb, sa <= sb, sa < sb, sa >= sb, sa > sb, sa.isdisjoint(sb))
+		print ('  ==, <=, <, >=, >, isdisjoint: %r' % (compared,))
+		if compared != (pa == pb, pa <= pb, pa < pb, pa >= pb, pa > pb, pa.isdisjoint(pb)):
+			TotalErrorCount += 1
+			print ('ERROR -- comparisons do not agree with python sets')
+		if sa | sb != sb | sa or hash(sa | sb) != hash(srange((sa | sb).list() or '')):
+			TotalErrorCount += 1
+			print ('ERROR -- equal sranges are not equal, or have different hashes')
+
+	test_set('1-10', '5-20')				# overlapping
+	test_set('1-10', '12-20')				# disjoint
+	test_set('0-30:2', '0-30:3')			# strides that interleave
+	test_set('0-20:2', '1-21:2')			# evens and odds
+	test_set('1-100', '0-100:3')			# difference is not a simple range
+	test_set('-5-5,10,20-30:5', '3,10-25')
+	test_set('1-5', '')						# an empty range
+	test_set('1,3,5,7', '1-7:2')			# the same values, compacted differently
+	test_set('4-8:2', '1-10')				# a subset
+	test_set('0-60', '0-60:7')				# a cut at every 7th value
+	test_set('0-60:4', '2-62:4')			# strides that interleave into one simple range
+	test_set('0-60:2', '0-60:6')			# one stride inside the other
+	test_set('0-60:3', '1-61:3')			# the same stride, not interleaving evenly
+
+	print ('\n---------------------------------------------')
+	result = srange('0-9999999') - srange('0-9999999:1000')	# made from 10000 simple ranges, not 1e7 values
+	print ('  "0-9999999" - "0-9999999:1000": %d values in %d simple ranges' % (result.len(), result.segment_count()))
+	if result.len() != 9990000 or result.segment_count() != 10000 or (srange('0-inf') - srange('0-inf:2')).segment_count() != 1:
+		TotalErrorCount += 1
+		print ('ERROR -- a large difference should have been 9990000 values in 10000 simple ranges')
+
+	print ('\n---------------------------------------------')
+	sr = srange('1-10,20-30:2')
+	values = set(sr.list())
+	for (name, args) in (('discard', (5,)), ('add', (5,)), ('add', (12,)), ('add_range', (14, 19, 2)),
+			('discard_range', (1, 30, 3)), ('add_range', (0, 40)), ('discard', (99,))):
+		sr.index(0)							# the counts are cached, so the change must update them
+		getattr(sr, name)(*args)
+		if name.endswith('_range'):
+			changed = set(range(args[0], args[1]+1, args[2] if len(args) > 2 else 1))
+		else:
+			changed = set(args)
+		values = values | changed if name.startswith('add') else values - changed
+		print ('  %-26s %s' % ('%s%r:' % (name, args), sr))
+		if sr.list() != sorted(values) or sr.len() != len(values) or \
+				[sr.index(n) for n in range(len(values))] != sorted(values) or [sr.val2index(v) for v in sorted(values)] != list(range(len(values))):
+			TotalErrorCount += 1
+			print ('ERROR -- %s should have given %r' % (name, sorted(values)))
+
+if testGroup & 16:							# tests of srange_builder
+	print ('\n\n========== Tests of srange_builder ==========\n\n')
+	for values in ([1, 2, 3, 5, 7, 9, 20], [1, 3, 4, 5, 6], [0, 2, 4, 5, 6, 7, 10, 20, 30], [5], []):
+		b = srange_builder()
+		for v in values:
+			b.append(v)
+		print ('  %-30r  built: %-20s  srange(list): %s' % (values, b.build(), srange(values or '')))
+		if b.build().l != srange(values or '').l:
+			TotalErrorCount += 1
+			print ('ERROR -- srange_builder and srange(list) disagree')
+	b = srange_builder()
+	b.extend([1, 2, (3, 9, 3), 10, 11])
+	print ('  with simple ranges:  built: %s' % b.build())
+
+if testGroup & 32:							# tests of asyncio support
+	import asyncio
+	print ('\n\n========== Tests of asyncio support ==========\n\n')
+	async def double(i):
+		await asyncio.sleep(0.001 * (i % 3))	# later values can finish first
+		return 2 * i
+	async def async_test(test_str):
+		global TotalErrorCount
+		sr = srange(test_str)
+		values = [i async for i in sr]
+		doubled = [i async for i in sr.amap(double, concurrency=3)]
+		print ('  %-20s async for: %r   amap: %r' % (test_str, values, doubled))
+		if values != sr.list() or doubled != [2 * i for i in sr]:
+			TotalErrorCount += 1
+			print ('ERROR -- async results do not match the list of values')
+	for test_str in ('1-10', '0-20:4,30', '5', ''):
+		asyncio.run(async_test(test_str))
+
+if testGroup & 64:							# tests of instrumentation
+	print ('\n\n========== Tests of instrumentation ==========\n\n')
+	def results(sr):
+		return (sr.list(), sr.index(3), sr.val2index(9), sr.is_in_range(9), sr.after(9), sr[1:4].l)
+	plain = results(srange('1-10,20-40:5'))
+	srange.set_stats(True)
+	srange.stats_clear()
+	srange.cache_clear()					# so that the string is parsed again
+	sr = srange('1-10,20-40:5')
+	counted = results(sr)
+	sr.sub_range(2, 3)
+	srange.set_stats(False)
+	print ('  results without stats: %r' % (plain,))
+	print ('  results with stats:    %r' % (counted,))
+	calls = dict((op, stats.calls) for (op, stats) in srange.stats_info().items())
+	for (op, stats) in sorted(srange.stats_info().items()):
+		print ('  %-8s calls=%d  segments=%d' % (op, stats.calls, stats.segments))
+	expected = {'parse': 1, 'compact': 1, 'iterate': 2, 'index': 4, 'lookup': 1}	# one count per call made here
+	if counted != plain or calls != expected or sr.stats()['index'].calls != 4:
+		TotalErrorCount += 1
+		print ('ERROR -- instrumentation changed the results or the calls should have been counted as %r' % expected)
+
+if testGroup & 128:							# tests of parallel_map and parallel_for
+	import time
+	import threading
+	from concurrent.futures import ThreadPoolExecutor
+	from srange import symrange
+	print ('\n\n========== Tests of parallel_map and parallel_for ==========\n\n')
+	def test_parallel(name, result, expected):
+		global TotalErrorCount
+		print ('  %-36s %r' % (name+':', result))
+		if result != expected:
+			TotalErrorCount += 1
+			print ('ERROR -- %s should have been %r' % (name, expected))
+
+	sr = srange('-5-20,30-60:3')
+	squares = [v*v for v in sr]
+	test_parallel('ordered, chunk=4', list(sr.parallel_map(lambda v: v*v, chunk=4)), squares)
+	test_parallel('unordered, sorted', sorted(sr.parallel_map(lambda v: v*v, chunk=3, ordered=False)), sorted(squares))
+	test_parallel('process pool', list(sr.parallel_map(abs, executor='process', chunk=5, max_workers=2)),
+		[abs(v) for v in sr])
+	test_parallel('empty range', list(srange('').parallel_map(abs)), [])
+	test_parallel('symrange(3), process pool', list(symrange(3).parallel_map(abs, executor='process', chunk=2)),
+		[abs(v) for v in symrange(3)])
+	done = []
+	sr.parallel_for(done.append, chunk=7)
+	test_parallel('parallel_for, values done', sorted(done), sr.list())
+
+	for (name, run) in (('parallel_map', lambda: list(sr.parallel_map(lambda v: 1//(v-3), chunk=4))),
+			('parallel_for', lambda: sr.parallel_for(lambda v: 1//(v-3), chunk=4)),
+			('chunk=0', lambda: list(sr.parallel_map(abs, chunk=0)))):
+		try:
+			run()
+			TotalErrorCount += 1
+			print ('ERROR -- %s should have raised an exception' % name)
+		except (ZeroDivisionError, ValueError) as err:
+			print ('  %-36s %s: %s' % (name+' raised:', type(err).__name__, err))
+
+	calls = []									# stop after the first result, the waiting chunks are cancelled
+	lock = threading.Lock()
+	def slow(v):
+		with lock:
+			calls.append(v)
+		time.sleep(0.01)
+		return v
+	pool = ThreadPoolExecutor(1)
+	results = sr.parallel_map(slow, executor=pool, chunk=1, max_pending=4)
+	first = next(results)
+	results.close()
+	pool.shutdown(wait=True)
+	print ('  %-36s first=%r, %d of %d values called' % ('closed early:', first, len(calls), sr.len()))
+	if first != sr[0] or len(calls) > 4:
+		TotalErrorCount += 1
+		print ('ERROR -- closing parallel_map() did not cancel the pending chunks')
+
 if TotalErrorCount > 0:	print('\nTotal number of real Errors is: %d' % TotalErrorCount)
 else:					print('\nAll OK, No Errors')